@@ -10,14 +10,132 @@ class Settings:
     TEABLE_BASE_URL: str = os.getenv("TEABLE_BASE_URL", "https://app.teable.io/api")
     TEABLE_TOKEN: str = os.getenv("TEABLE_TOKEN", "Bearer teable_accT1cTLbgDxAw73HQa_xnRuWiEDLat6qqpUDsL4QEzwnKwnkU9ErG7zgJKJswg=")
     TEABLE_TABLE_ID: str = os.getenv("TEABLE_TABLE_ID", "tblv9Ou1thzbETynKn1")
+
+    # HTTP Client Configuration (shared async connection pools)
+    TEABLE_TIMEOUT: float = float(os.getenv("TEABLE_TIMEOUT", "30"))
+    TEABLE_CONNECT_TIMEOUT: float = float(os.getenv("TEABLE_CONNECT_TIMEOUT", "5"))
+    TEABLE_MAX_CONNECTIONS: int = int(os.getenv("TEABLE_MAX_CONNECTIONS", "200"))
+    TEABLE_MAX_KEEPALIVE_CONNECTIONS: int = int(os.getenv("TEABLE_MAX_KEEPALIVE_CONNECTIONS", "50"))
+    TEABLE_KEEPALIVE_EXPIRY: float = float(os.getenv("TEABLE_KEEPALIVE_EXPIRY", "30"))
+    EXTERNAL_HTTP_TIMEOUT: float = float(os.getenv("EXTERNAL_HTTP_TIMEOUT", "60"))
+    EXTERNAL_MAX_CONNECTIONS: int = int(os.getenv("EXTERNAL_MAX_CONNECTIONS", "100"))
+
+    # Teable Batch Write Configuration
+    TEABLE_BATCH_SIZE: int = int(os.getenv("TEABLE_BATCH_SIZE", "500"))
+    TEABLE_BATCH_CONCURRENCY: int = int(os.getenv("TEABLE_BATCH_CONCURRENCY", "8"))
+    # Single-record updates arriving within this window are merged into one bulk PATCH (opt-in, 0 disables)
+    TEABLE_WRITE_COALESCE_WINDOW: float = float(os.getenv("TEABLE_WRITE_COALESCE_WINDOW", "0"))
+
+    # User Record Cache Configuration
+    USER_CACHE_TTL: float = float(os.getenv("USER_CACHE_TTL", "300"))
+    USER_CACHE_MAXSIZE: int = int(os.getenv("USER_CACHE_MAXSIZE", "1024"))
+
+    # Session Token Configuration (HMAC-signed tokens issued at signin and verified locally)
+    SESSION_SECRET: str = os.getenv("SESSION_SECRET", "")
+    SESSION_TTL: float = float(os.getenv("SESSION_TTL", "43200"))
+    # When false, requests without a session token still fall back to tenant fields in the body
+    SESSION_REQUIRED: bool = os.getenv("SESSION_REQUIRED", "false").lower() == "true"
+
+    # Last Login Configuration (signin timestamps are buffered and written to Teable in bulk)
+    LAST_LOGIN_FLUSH_INTERVAL: float = float(os.getenv("LAST_LOGIN_FLUSH_INTERVAL", "10"))
+
+    # Warm Pool Configuration (pre-provisioned tenant workspaces, 0 disables the pool)
+    WARM_POOL_SIZE: int = int(os.getenv("WARM_POOL_SIZE", "0"))
+    WARM_POOL_FILE: str = os.getenv("WARM_POOL_FILE", "data/workspace_pool.json")
+    WARM_POOL_RETRY_DELAY: float = float(os.getenv("WARM_POOL_RETRY_DELAY", "30"))
+
+    # Order Export Configuration (orders per Teable page when streaming an export)
+    EXPORT_PAGE_SIZE: int = int(os.getenv("EXPORT_PAGE_SIZE", "500"))
+
+    # Order Queue Configuration (accept orders locally and flush them to Teable in the background)
+    ORDER_QUEUE_ENABLED: bool = os.getenv("ORDER_QUEUE_ENABLED", "false").lower() == "true"
+    ORDER_QUEUE_PATH: str = os.getenv("ORDER_QUEUE_PATH", "data/order_queue.db")
+    ORDER_QUEUE_BATCH_SIZE: int = int(os.getenv("ORDER_QUEUE_BATCH_SIZE", "200"))
+    ORDER_QUEUE_FLUSH_INTERVAL: float = float(os.getenv("ORDER_QUEUE_FLUSH_INTERVAL", "1.0"))
+    ORDER_QUEUE_MAX_ATTEMPTS: int = int(os.getenv("ORDER_QUEUE_MAX_ATTEMPTS", "10"))
+
+    # Invoice Job Configuration
+    INVOICE_JOBS_PATH: str = os.getenv("INVOICE_JOBS_PATH", "data/invoice_jobs.db")
+    INVOICE_JOB_WORKERS: int = int(os.getenv("INVOICE_JOB_WORKERS", "8"))
+    INVOICE_JOB_PER_TENANT: int = int(os.getenv("INVOICE_JOB_PER_TENANT", "2"))
+    INVOICE_BATCH_CONCURRENCY: int = int(os.getenv("INVOICE_BATCH_CONCURRENCY", "4"))
+
+    # Invoice PDF Store Configuration
+    PDF_STORE_DIR: str = os.getenv("PDF_STORE_DIR", "data/pdf_store")
+    PDF_STORE_MAX_BYTES: int = int(os.getenv("PDF_STORE_MAX_BYTES", str(512 * 1024 * 1024)))
     
     # Invoice API Configuration
     CREATE_INVOICE_URL: str = os.getenv("CREATE_INVOICE_URL", "https://api-vinvoice.viettel.vn/services/einvoiceapplication/api/InvoiceAPI/InvoiceWS/createInvoice")
     GET_PDF_URL: str = os.getenv("GET_PDF_URL", "https://api-vinvoice.viettel.vn/services/einvoiceapplication/api/InvoiceAPI/InvoiceUtilsWS/getInvoiceRepresentationFile")
     
+    # VietQR Taxcode Lookup Configuration (invalid codes are cached for a short negative TTL)
+    VIETQR_BUSINESS_URL: str = os.getenv("VIETQR_BUSINESS_URL", "https://api.vietqr.io/v2/business")
+    VIETQR_TIMEOUT: float = float(os.getenv("VIETQR_TIMEOUT", "5"))
+    TAXCODE_CACHE_TTL: float = float(os.getenv("TAXCODE_CACHE_TTL", str(30 * 24 * 3600)))
+    TAXCODE_NEGATIVE_TTL: float = float(os.getenv("TAXCODE_NEGATIVE_TTL", "600"))
+    TAXCODE_CACHE_MAXSIZE: int = int(os.getenv("TAXCODE_CACHE_MAXSIZE", "4096"))
+    TAXCODE_CACHE_PATH: str = os.getenv("TAXCODE_CACHE_PATH", "data/taxcode_cache.db")
+
     # OpenRouter API Configuration
     OPENROUTER_API_KEY: str = os.getenv("OPENROUTER_API_KEY", "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")
+    OPENROUTER_URL: str = os.getenv("OPENROUTER_URL", "https://openrouter.ai/api/v1/chat/completions")
+    OPENROUTER_MODEL: str = os.getenv("OPENROUTER_MODEL", "deepseek/deepseek-r1-0528-qwen3-8b:free")
+    OPENROUTER_HEDGE_MODEL: str = os.getenv("OPENROUTER_HEDGE_MODEL", "")
+
+    # LLM Extraction Limits (hedging fires a second attempt after the p95 latency)
+    LLM_DEADLINE_S: float = float(os.getenv("LLM_DEADLINE_S", "20"))
+    LLM_MAX_CONCURRENCY: int = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+    LLM_PER_TENANT: int = int(os.getenv("LLM_PER_TENANT", "2"))
+    LLM_HEDGE_ENABLED: bool = os.getenv("LLM_HEDGE_ENABLED", "false").lower() == "true"
+    LLM_HEDGE_DELAY_S: float = float(os.getenv("LLM_HEDGE_DELAY_S", "6"))
+    LLM_HEDGE_MIN_DELAY_S: float = float(os.getenv("LLM_HEDGE_MIN_DELAY_S", "1"))
+
+    # Order Extraction Configuration (rule-based parser answers without the LLM at or above this confidence)
+    LOCAL_PARSER_MIN_CONFIDENCE: float = float(os.getenv("LOCAL_PARSER_MIN_CONFIDENCE", "0.8"))
+
+    # Extraction Cache (LLM results keyed by normalized transcript; empty path disables the JSON snapshot)
+    EXTRACTION_CACHE_TTL: int = int(os.getenv("EXTRACTION_CACHE_TTL", "86400"))
+    EXTRACTION_CACHE_MAXSIZE: int = int(os.getenv("EXTRACTION_CACHE_MAXSIZE", "5000"))
+    EXTRACTION_CACHE_PATH: str = os.getenv("EXTRACTION_CACHE_PATH", "data/extraction_cache.json")
+    EXTRACTION_CACHE_SAVE_INTERVAL: float = float(os.getenv("EXTRACTION_CACHE_SAVE_INTERVAL", "60"))
+
+    # Product Catalog Index (per-tenant fuzzy lookup of extracted items)
+    CATALOG_REFRESH_INTERVAL: float = float(os.getenv("CATALOG_REFRESH_INTERVAL", "300"))
+    CATALOG_MAX_TENANTS: int = int(os.getenv("CATALOG_MAX_TENANTS", "200"))
+    CATALOG_MATCH_THRESHOLD: float = float(os.getenv("CATALOG_MATCH_THRESHOLD", "0.45"))
     
+    # Transcription Configuration (Whisper worker-process pool)
+    TRANSCRIPTION_ENABLED: bool = os.getenv("TRANSCRIPTION_ENABLED", "true").lower() == "true"
+    # Tiers as model:beam_size:compute_type, most accurate first; all are kept loaded in every worker
+    WHISPER_TIERS: str = os.getenv("WHISPER_TIERS", "small:5:int8,base:2:int8,tiny:1:int8")
+    WHISPER_LATENCY_BUDGET_S: float = float(os.getenv("WHISPER_LATENCY_BUDGET_S", "4"))
+    WHISPER_WORKERS: int = int(os.getenv("WHISPER_WORKERS", "2"))
+    WHISPER_CPU_THREADS: int = int(os.getenv("WHISPER_CPU_THREADS", "2"))
+    WHISPER_PIN_CPUS: bool = os.getenv("WHISPER_PIN_CPUS", "true").lower() == "true"
+    WHISPER_MAX_QUEUE: int = int(os.getenv("WHISPER_MAX_QUEUE", "32"))
+    WHISPER_BATCH_SIZE: int = int(os.getenv("WHISPER_BATCH_SIZE", "4"))
+    WHISPER_BATCH_WINDOW_MS: float = float(os.getenv("WHISPER_BATCH_WINDOW_MS", "20"))
+    WHISPER_BATCH_MAX_BYTES: int = int(os.getenv("WHISPER_BATCH_MAX_BYTES", str(256 * 1024)))
+
+    # Audio Upload Limits (decoded in memory to 16 kHz mono before inference)
+    AUDIO_MAX_BYTES: int = int(os.getenv("AUDIO_MAX_BYTES", str(20 * 1024 * 1024)))
+    AUDIO_MAX_DURATION_S: int = int(os.getenv("AUDIO_MAX_DURATION_S", "300"))
+    AUDIO_SILENCE_THRESHOLD: float = float(os.getenv("AUDIO_SILENCE_THRESHOLD", "0.003"))
+
+    # Transcription Result Cache (keyed by SHA-256 of the uploaded audio; empty path disables the disk tier)
+    TRANSCRIPTION_CACHE_TTL: int = int(os.getenv("TRANSCRIPTION_CACHE_TTL", "3600"))
+    TRANSCRIPTION_CACHE_MAXSIZE: int = int(os.getenv("TRANSCRIPTION_CACHE_MAXSIZE", "256"))
+    TRANSCRIPTION_CACHE_PATH: str = os.getenv("TRANSCRIPTION_CACHE_PATH", "data/transcription_cache.db")
+    TRANSCRIPTION_CACHE_DISK_MAXSIZE: int = int(os.getenv("TRANSCRIPTION_CACHE_DISK_MAXSIZE", "10000"))
+
+    # Streaming Transcription Configuration (16 kHz mono 16-bit PCM over WebSocket)
+    STREAM_VAD_FRAME_MS: int = int(os.getenv("STREAM_VAD_FRAME_MS", "30"))
+    STREAM_VAD_THRESHOLD: float = float(os.getenv("STREAM_VAD_THRESHOLD", "0.01"))
+    STREAM_SILENCE_MS: int = int(os.getenv("STREAM_SILENCE_MS", "600"))
+    STREAM_MIN_SEGMENT_MS: int = int(os.getenv("STREAM_MIN_SEGMENT_MS", "300"))
+    STREAM_MAX_SEGMENT_MS: int = int(os.getenv("STREAM_MAX_SEGMENT_MS", "15000"))
+    STREAM_MAX_DURATION_S: int = int(os.getenv("STREAM_MAX_DURATION_S", "300"))
+
     # Server Configuration
     PORT: int = int(os.getenv("PORT", "8000"))
     HOST: str = os.getenv("HOST", "0.0.0.0")
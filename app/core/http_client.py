@@ -0,0 +1,63 @@
+import logging
+from typing import Optional
+import httpx
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Shared connection pools, created and closed with the app lifespan
+_teable_client: Optional[httpx.AsyncClient] = None
+_external_client: Optional[httpx.AsyncClient] = None
+
+def _build_teable_client() -> httpx.AsyncClient:
+    """Build the pooled keep-alive client used for every Teable call"""
+    return httpx.AsyncClient(
+        headers={"Authorization": settings.TEABLE_TOKEN, "Accept": "application/json"},
+        timeout=httpx.Timeout(settings.TEABLE_TIMEOUT, connect=settings.TEABLE_CONNECT_TIMEOUT),
+        limits=httpx.Limits(
+            max_connections=settings.TEABLE_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.TEABLE_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.TEABLE_KEEPALIVE_EXPIRY,
+        ),
+    )
+
+def _build_external_client() -> httpx.AsyncClient:
+    """Build the pooled client used for third-party APIs (Viettel, VietQR, OpenRouter)"""
+    return httpx.AsyncClient(
+        timeout=httpx.Timeout(settings.EXTERNAL_HTTP_TIMEOUT, connect=settings.TEABLE_CONNECT_TIMEOUT),
+        limits=httpx.Limits(max_connections=settings.EXTERNAL_MAX_CONNECTIONS),
+    )
+
+async def start_http_clients() -> None:
+    """Open the shared HTTP clients (called on app startup)"""
+    global _teable_client, _external_client
+    if _teable_client is None:
+        _teable_client = _build_teable_client()
+    if _external_client is None:
+        _external_client = _build_external_client()
+    logger.info("HTTP client pools started")
+
+async def close_http_clients() -> None:
+    """Close the shared HTTP clients (called on app shutdown)"""
+    global _teable_client, _external_client
+    if _teable_client is not None:
+        await _teable_client.aclose()
+        _teable_client = None
+    if _external_client is not None:
+        await _external_client.aclose()
+        _external_client = None
+    logger.info("HTTP client pools closed")
+
+def get_teable_client() -> httpx.AsyncClient:
+    """Return the shared Teable client, creating it lazily outside the app lifespan"""
+    global _teable_client
+    if _teable_client is None:
+        _teable_client = _build_teable_client()
+    return _teable_client
+
+def get_external_client() -> httpx.AsyncClient:
+    """Return the shared third-party client, creating it lazily outside the app lifespan"""
+    global _external_client
+    if _external_client is None:
+        _external_client = _build_external_client()
+    return _external_client
@@ -0,0 +1,97 @@
+import hmac
+import json
+import time
+import base64
+import hashlib
+import logging
+import secrets
+from typing import Any, Dict, Optional, TypeVar
+from fastapi import Depends, HTTPException, WebSocket, status
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from pydantic import BaseModel
+from app.core.config import settings
+from app.schemas.auth import TenantContext
+
+logger = logging.getLogger(__name__)
+
+if settings.SESSION_SECRET:
+    _secret = settings.SESSION_SECRET.encode("utf-8")
+else:
+    # Tokens then only survive as long as this process; set SESSION_SECRET in production
+    logger.warning("SESSION_SECRET is not set, using a random per-process session secret")
+    _secret = secrets.token_bytes(32)
+
+_bearer = HTTPBearer(auto_error=False)
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+def _sign(payload: str) -> str:
+    return _b64encode(hmac.new(_secret, payload.encode("ascii"), hashlib.sha256).digest())
+
+def create_session_token(tenant: TenantContext, ttl: Optional[float] = None) -> str:
+    """Mint a signed token "<payload>.<signature>" carrying the tenant context and an expiry"""
+    claims = {**tenant.model_dump(), "exp": int(time.time() + (ttl or settings.SESSION_TTL))}
+    payload = _b64encode(json.dumps(claims, separators=(",", ":"), ensure_ascii=False).encode("utf-8"))
+    return f"{payload}.{_sign(payload)}"
+
+def verify_session_token(token: str) -> TenantContext:
+    """Check the signature and expiry of a session token without any Teable lookup"""
+    unauthorized = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Phiên đăng nhập không hợp lệ hoặc đã hết hạn",
+        headers={"WWW-Authenticate": "Bearer"}
+    )
+    payload, _, signature = token.partition(".")
+    if not payload or not signature:
+        raise unauthorized
+    try:
+        valid = hmac.compare_digest(signature, _sign(payload))
+    except (TypeError, UnicodeEncodeError):
+        valid = False
+    if not valid:
+        raise unauthorized
+    claims: Dict[str, Any] = json.loads(_b64decode(payload))
+    if claims.pop("exp", 0) < time.time():
+        raise unauthorized
+    return TenantContext(**claims)
+
+async def get_tenant(credentials: Optional[HTTPAuthorizationCredentials] = Depends(_bearer)) -> Optional[TenantContext]:
+    """Tenant context from the Bearer session token, or None when no token is sent and sessions are optional"""
+    if credentials is None:
+        if settings.SESSION_REQUIRED:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Yêu cầu đăng nhập", headers={"WWW-Authenticate": "Bearer"})
+        return None
+    return verify_session_token(credentials.credentials)
+
+async def require_tenant(tenant: Optional[TenantContext] = Depends(get_tenant)) -> TenantContext:
+    """Tenant context for routes that must never fall back to identities taken from the request"""
+    if tenant is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Yêu cầu đăng nhập", headers={"WWW-Authenticate": "Bearer"})
+    return tenant
+
+def get_websocket_tenant(websocket: WebSocket) -> Optional[TenantContext]:
+    """Tenant context for a WebSocket, from ?token= (browsers cannot set headers) or a Bearer header"""
+    token = websocket.query_params.get("token")
+    if not token:
+        scheme, _, credentials = websocket.headers.get("authorization", "").partition(" ")
+        token = credentials if scheme.lower() == "bearer" else ""
+    if not token:
+        if settings.SESSION_REQUIRED:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Yêu cầu đăng nhập")
+        return None
+    return verify_session_token(token)
+
+Model = TypeVar("Model", bound=BaseModel)
+
+def bind_tenant(data: Model, tenant: Optional[TenantContext], **fields: str) -> Model:
+    """Fill request fields from the tenant context (request field -> tenant attribute), token values taking precedence"""
+    if tenant is not None:
+        data = data.model_copy(update={field: getattr(tenant, attr) or getattr(data, field) for field, attr in fields.items()})
+    missing = [field for field in fields if not getattr(data, field)]
+    if missing:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Thiếu thông tin: {', '.join(missing)}")
+    return data
@@ -155,25 +155,29 @@
 #         return {"error": str(e)}
 
 
-import requests
 import json
+import asyncio
+import logging
+import threading
+from collections import deque
+from contextlib import nullcontext
+from typing import Any, Callable, Dict, List, Optional
 from app.core.config import settings
+from app.core.http_client import get_external_client
+from app.order_parser import parse_order_text
+from app.services.extraction_cache import extraction_cache
 
-def extract_info_from_text(text: str):
-    try:
-
-        response = requests.post(
-        url="https://openrouter.ai/api/v1/chat/completions",
-        headers={
-            "Authorization": f"Bearer {settings.OPENROUTER_API_KEY}",
-            "Content-Type": "application/json",
-        },
-        data=json.dumps({
-            "model": "deepseek/deepseek-r1-0528-qwen3-8b:free",
-            "messages": [
-            {
-                "role": "user",
-                "content": f"""
+logger = logging.getLogger(__name__)
+
+_served_lock = threading.Lock()
+_served = {"local": 0, "cache": 0, "llm": 0}
+
+def _count_served(source: str) -> None:
+    with _served_lock:
+        _served[source] += 1
+
+def _build_prompt(text: str) -> str:
+    return f"""
                             Bạn là một AI hỗ trợ phân tích hóa đơn từ văn bản tiếng Việt.
 
                             Yêu cầu:
@@ -191,20 +195,207 @@ def extract_info_from_text(text: str):
                             Câu cần phân tích:
                             "{text}"
                 """
-            }
-            ],
-            
-        })
-        )
 
-        response.raise_for_status()
-        data = response.json()
-        result = data["choices"][0]["message"]["content"]
+class _JsonArrayStream:
+    """Yields each top-level object of a JSON array as soon as its closing brace arrives"""
+
+    def __init__(self):
+        self._started = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._buffer: List[str] = []
+
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        items = []
+        for ch in chunk:
+            if not self._started:
+                self._started = ch == "["
+                continue
+            if self._depth == 0:
+                if ch == "{":
+                    self._depth, self._buffer = 1, ["{"]
+                continue
+            self._buffer.append(ch)
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch == "{":
+                self._depth += 1
+            elif ch == "}":
+                self._depth -= 1
+                if self._depth == 0:
+                    try:
+                        items.append(json.loads("".join(self._buffer)))
+                    except ValueError:
+                        pass
+                    self._buffer = []
+        return items
+
+class LLMExtractionClient:
+    """Async OpenRouter extraction with a deadline, global and per-tenant concurrency caps and optional hedging"""
+
+    def __init__(self, model: str, hedge_model: str, deadline: float, max_concurrency: int, per_tenant: int,
+                 hedge_enabled: bool, hedge_delay: float, hedge_min_delay: float):
+        self.model = model
+        self.hedge_model = hedge_model or model
+        self.deadline = deadline
+        self.per_tenant = per_tenant
+        self.hedge_enabled = hedge_enabled
+        self.default_hedge_delay = hedge_delay
+        self.hedge_min_delay = hedge_min_delay
+        self.requests = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.timeouts = 0
+        self.errors = 0
+        self._global_slots = asyncio.Semaphore(max_concurrency)
+        self._tenant_slots: Dict[str, asyncio.Semaphore] = {}
+        self._latencies: deque = deque(maxlen=200)
+
+    def hedge_delay(self) -> float:
+        """p95 of recent successful latencies, once there are enough samples"""
+        if len(self._latencies) < 20:
+            return self.default_hedge_delay
+        latencies = sorted(self._latencies)
+        return max(latencies[int(0.95 * (len(latencies) - 1))], self.hedge_min_delay)
+
+    async def _attempt(self, model: str, prompt: str, on_item: Callable[[Dict[str, Any]], None]) -> Any:
+        payload = {"model": model, "stream": True, "messages": [{"role": "user", "content": prompt}]}
+        headers = {"Authorization": f"Bearer {settings.OPENROUTER_API_KEY}", "Content-Type": "application/json"}
+        parser, content = _JsonArrayStream(), []
+        async with get_external_client().stream("POST", settings.OPENROUTER_URL, json=payload, headers=headers, timeout=self.deadline) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                # Server-sent events; lines starting with ":" are keep-alive comments
+                if not line.startswith("data:"):
+                    continue
+                data = line[5:].strip()
+                if data == "[DONE]":
+                    break
+                chunk = json.loads(data)
+                if "error" in chunk:
+                    raise RuntimeError(chunk["error"].get("message", str(chunk["error"])))
+                delta = (chunk.get("choices") or [{}])[0].get("delta", {}).get("content") or ""
+                content.append(delta)
+                for item in parser.feed(delta):
+                    on_item(item)
 
         # Clean markdown if any slipped in
-        result = result.strip().replace("```json", "").replace("```", "").strip()
-
+        result = "".join(content).strip().replace("```json", "").replace("```", "").strip()
         return json.loads(result)
 
-    except Exception as e:
-        return {"error": str(e)}
+    async def _race(self, prompt: str, on_item: Optional[Callable[[Dict[str, Any]], None]]) -> Any:
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        owner: List[str] = []
+
+        def emit(attempt: str) -> Callable[[Dict[str, Any]], None]:
+            # Only the attempt that streams first forwards partial items, so a hedge never duplicates them
+            def callback(item: Dict[str, Any]) -> None:
+                if not owner:
+                    owner.append(attempt)
+                if on_item is not None and owner[0] == attempt:
+                    on_item(item)
+            return callback
+
+        primary = asyncio.create_task(self._attempt(self.model, prompt, emit("primary")))
+        tasks = {primary}
+        if self.hedge_enabled:
+            done, _ = await asyncio.wait(tasks, timeout=self.hedge_delay())
+            # Hedge only with spare global capacity, so hedging never queues behind real requests
+            if not done and not self._global_slots.locked():
+                await self._global_slots.acquire()
+                self.hedged += 1
+                hedge = asyncio.create_task(self._attempt(self.hedge_model, prompt, emit("hedge")))
+                hedge.add_done_callback(lambda _: self._global_slots.release())
+                tasks.add(hedge)
+
+        try:
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        self._latencies.append(loop.time() - started)
+                        if task is not primary:
+                            self.hedge_wins += 1
+                        return task.result()
+            raise primary.exception()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def extract(self, text: str, tenant: Optional[str] = None,
+                      on_item: Optional[Callable[[Dict[str, Any]], None]] = None) -> Any:
+        """Return the extracted JSON array, or {"error": ...}; never waits longer than the deadline"""
+        self.requests += 1
+        # Callers without a tenant share only the global cap, not one tenant bucket
+        tenant_slots = self._tenant_slots.setdefault(tenant, asyncio.Semaphore(self.per_tenant)) if tenant else nullcontext()
+
+        async def run() -> Any:
+            async with tenant_slots, self._global_slots:
+                return await self._race(_build_prompt(text), on_item)
+
+        try:
+            return await asyncio.wait_for(run(), timeout=self.deadline)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            return {"error": f"Quá thời gian chờ trích xuất ({self.deadline:g}s)"}
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"LLM extraction failed: {str(e)}")
+            return {"error": str(e)}
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "in_flight_tenants": sum(1 for s in self._tenant_slots.values() if s.locked()),
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "hedge_delay": round(self.hedge_delay(), 3),
+            "timeouts": self.timeouts,
+            "errors": self.errors
+        }
+
+llm_client = LLMExtractionClient(
+    model=settings.OPENROUTER_MODEL,
+    hedge_model=settings.OPENROUTER_HEDGE_MODEL,
+    deadline=settings.LLM_DEADLINE_S,
+    max_concurrency=settings.LLM_MAX_CONCURRENCY,
+    per_tenant=settings.LLM_PER_TENANT,
+    hedge_enabled=settings.LLM_HEDGE_ENABLED,
+    hedge_delay=settings.LLM_HEDGE_DELAY_S,
+    hedge_min_delay=settings.LLM_HEDGE_MIN_DELAY_S
+)
+
+def extraction_stats() -> dict:
+    """How many extractions the local parser and the cache answered versus the LLM"""
+    total = sum(_served.values())
+    return {
+        "served": dict(_served),
+        "local_share": round(_served["local"] / total, 4) if total else 0.0,
+        "llm": llm_client.stats(),
+        "cache": extraction_cache.stats()
+    }
+
+async def extract_info_from_text(text: str, tenant: Optional[str] = None,
+                                 on_item: Optional[Callable[[Dict[str, Any]], None]] = None):
+    """Extract order items: rule-based parser first, then the extraction cache, then the LLM"""
+    items, confidence = parse_order_text(text)
+    if confidence >= settings.LOCAL_PARSER_MIN_CONFIDENCE:
+        _count_served("local")
+        return items
+    cached = extraction_cache.get(text)
+    if cached is not None:
+        _count_served("cache")
+        return cached
+    _count_served("llm")
+    result = await llm_client.extract(text, tenant, on_item)
+    extraction_cache.set(text, result)
+    return result
@@ -1,13 +1,57 @@
 import logging
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from app.core.http_client import start_http_clients, close_http_clients
+from app.services.teable_service import user_record_cache, record_writer
+from app.services.workspace_pool import workspace_pool
+from app.services.order_queue import order_queue
+from app.services.invoice_jobs import invoice_job_queue
+from app.services.pdf_store import pdf_store
+from app.services.whisper_pool import whisper_pool
+from app.services.transcription_cache import transcription_cache
+from app.core.config import settings
+from app.extractor import extraction_stats
+from app.services.extraction_cache import extraction_cache
+from app.services.catalog_index import catalog_index
+from app.services.last_login import last_login_buffer
+from app.services.taxcode_lookup import taxcode_lookup
 from app.routes import transcription, auth, orders, invoices
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="Order Voice Backend", version="1.0.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Open shared resources on startup and release them on shutdown"""
+    await start_http_clients()
+    workspace_pool.start()
+    last_login_buffer.start()
+    if settings.ORDER_QUEUE_ENABLED:
+        order_queue.start()
+    invoice_job_queue.start()
+    extraction_cache.start()
+    catalog_index.start()
+    if settings.TRANSCRIPTION_ENABLED:
+        await whisper_pool.start()
+    try:
+        yield
+    finally:
+        await whisper_pool.stop()
+        transcription_cache.close()
+        taxcode_lookup.close()
+        await extraction_cache.stop()
+        await catalog_index.stop()
+        await invoice_job_queue.stop()
+        pdf_store.close()
+        await order_queue.stop()
+        await workspace_pool.stop()
+        await last_login_buffer.stop()
+        await record_writer.stop()
+        await close_http_clients()
+
+app = FastAPI(title="Order Voice Backend", version="1.0.0", lifespan=lifespan)
 
 # Add CORS middleware
 app.add_middleware(
@@ -19,7 +63,7 @@ app.add_middleware(
 )
 
 # Include routers
-# app.include_router(transcription.router, tags=["transcription"])
+app.include_router(transcription.router, tags=["transcription"])
 app.include_router(auth.router, tags=["authentication"])
 app.include_router(orders.router, tags=["orders"])
 app.include_router(invoices.router, tags=["invoices"])
@@ -27,4 +71,22 @@ app.include_router(invoices.router, tags=["invoices"])
 @app.get("/")
 async def root():
     """Root endpoint"""
-    return {"message": "Order Voice Backend API", "version": "1.0.0"}
\ No newline at end of file
+    return {"message": "Order Voice Backend API", "version": "1.0.0"}
+
+@app.get("/stats")
+async def stats():
+    """In-process cache and queue statistics"""
+    return {
+        "user_cache": user_record_cache.stats(),
+        "teable_writes": record_writer.stats(),
+        "last_login": last_login_buffer.stats(),
+        "taxcode_lookup": taxcode_lookup.stats(),
+        "workspace_pool": workspace_pool.stats(),
+        "order_queue": order_queue.stats(),
+        "invoice_jobs": invoice_job_queue.stats(),
+        "pdf_store": pdf_store.stats(),
+        "whisper_pool": whisper_pool.stats(),
+        "transcription_cache": transcription_cache.stats(),
+        "extraction": extraction_stats(),
+        "catalog": catalog_index.stats()
+    }
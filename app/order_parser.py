@@ -0,0 +1,205 @@
+import re
+import unicodedata
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Tuple
+
+DIGITS = {
+    "không": 0, "một": 1, "mốt": 1, "hai": 2, "ba": 3, "bốn": 4, "tư": 4, "năm": 5, "lăm": 5, "nhăm": 5,
+    "sáu": 6, "bảy": 7, "bẩy": 7, "tám": 8, "chín": 9
+}
+SCALES = {"nghìn": 1000, "ngàn": 1000, "k": 1000, "triệu": 1000000, "tr": 1000000, "tỷ": 1000000000, "tỉ": 1000000000}
+NUMBER_WORDS = set(DIGITS) | set(SCALES) | {"mười", "mươi", "trăm", "linh", "lẻ", "rưỡi"}
+CURRENCY = {"đồng", "đ", "vnđ", "vnd"}
+UNITS = {
+    "cái", "chiếc", "con", "hộp", "thùng", "lon", "chai", "lốc", "két", "bao", "bịch", "gói", "túi", "cuộn", "cây",
+    "kg", "ký", "kí", "cân", "lạng", "gam", "g", "lít", "l", "ml", "mét", "m", "tấm", "bộ", "đôi", "cặp", "hũ", "lọ",
+    "vỉ", "tép", "bó", "quả", "trái", "ly", "cốc", "phần", "suất", "tờ", "quyển", "cuốn", "viên", "tuýp", "can", "xô"
+}
+PRICE_MARKERS = {"giá", "là", "mỗi", "@"}
+FILLERS = {"cho", "lấy", "bán", "mua", "tôi", "mình", "anh", "chị", "em", "gồm", "có", "đặt", "thêm", "nữa", "ơi"}
+SEPARATORS = {",", ";", ".", "và", "với", "cùng"}
+
+_TOKEN_RE = re.compile(r"\d+(?:[.,]\d+)*|[^\W\d_]+|[,;.@/]")
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN_RE.findall(unicodedata.normalize("NFC", text))
+
+def is_number_token(token: str) -> bool:
+    return token[0].isdigit() or token in NUMBER_WORDS
+
+def _parse_numeral(token: str) -> Decimal:
+    """Digits with Vietnamese separators: "2.180.000" -> 2180000, "2,5" -> 2.5"""
+    parts = re.split(r"[.,]", token)
+    if len(parts) > 1 and all(len(part) == 3 for part in parts[1:]):
+        return Decimal("".join(parts))
+    if len(parts) == 2:
+        return Decimal(f"{parts[0]}.{parts[1]}")
+    return Decimal("".join(parts))
+
+def parse_number(words: List[str]) -> Optional[Decimal]:
+    """Parse a run of Vietnamese number words and numerals, e.g. "hai triệu một trăm tám mươi nghìn" -> 2180000"""
+    total, group = Decimal(0), Decimal(0)
+    digit: Optional[Decimal] = None
+    last_scale, prev, shorthand, after_linh = None, None, False, False
+    for word in words:
+        if word[0].isdigit() or word in DIGITS:
+            if digit is not None:
+                return None
+            digit = _parse_numeral(word) if word[0].isdigit() else Decimal(DIGITS[word])
+            # "hai nghìn ba" means 2300: a bare digit right after a scale word is a tenth of that scale
+            shorthand = prev in SCALES or prev == "trăm"
+            if after_linh:
+                shorthand = False
+        elif word == "mười":
+            if digit is not None:
+                return None
+            group += 10
+        elif word == "mươi":
+            if digit is None:
+                return None
+            group += digit * 10
+            digit = None
+        elif word == "trăm":
+            group += (digit if digit is not None else 1) * 100
+            digit, last_scale = None, 100
+        elif word in ("linh", "lẻ"):
+            after_linh = True
+            prev = word
+            continue
+        elif word in SCALES:
+            scale = SCALES[word]
+            value = group + (digit or 0)
+            total += (value or 1) * scale
+            group, digit, last_scale = Decimal(0), None, scale
+        elif word == "rưỡi":
+            if prev == "trăm":
+                group += 50
+            elif prev in SCALES:
+                total += Decimal(SCALES[prev]) / 2
+            else:
+                return None
+        else:
+            return None
+        after_linh = False
+        prev = word
+
+    if digit is not None:
+        if shorthand and last_scale:
+            digit = digit * last_scale / 10
+        group += digit
+    if prev is None:
+        return None
+    return total + group
+
+def _to_number(value: Decimal) -> Any:
+    return int(value) if value == value.to_integral_value() else float(value)
+
+def _take_number(tokens: List[str], start: int) -> Tuple[Optional[Decimal], int]:
+    end = start
+    while end < len(tokens) and is_number_token(tokens[end]):
+        end += 1
+    # In "... trăm nghìn ba lốc sữa" the last digit is the next item's quantity, not part of the price
+    if (end - start > 2 and end < len(tokens) and tokens[end] in UNITS and tokens[end - 1] in DIGITS and
+            (tokens[end - 2] in SCALES or tokens[end - 2] == "trăm")):
+        end -= 1
+    if end == start:
+        return None, start
+    return parse_number(tokens[start:end]), end
+
+def _parse_item(raw: List[str], start: int) -> Tuple[Optional[Dict[str, Any]], float, int]:
+    """Parse one "[quantity] [unit] name [giá] price [đồng] [mỗi unit]" item; returns (item, confidence, next index)"""
+    tokens = [token.lower() for token in raw]
+    confidence = 1.0
+    i = start
+    while i < len(tokens) and tokens[i] in FILLERS:
+        i += 1
+
+    quantity, unit = None, None
+    number, end = _take_number(tokens, i)
+    if number is not None and end < len(tokens) and tokens[end] in UNITS:
+        quantity, unit, i = number, tokens[end], end + 1
+    elif number is not None and end < len(tokens) and not any(t in SCALES for t in tokens[i:end]):
+        # "một máy giặt": a quantity without a known unit
+        quantity, i = number, end
+    elif i < len(tokens) and tokens[i] in UNITS:
+        unit, i = tokens[i], i + 1
+
+    name: List[str] = []
+    while i < len(tokens) and tokens[i] not in PRICE_MARKERS:
+        if is_number_token(tokens[i]):
+            number, end = _take_number(tokens, i)
+            trailing = tokens[end] if end < len(tokens) else None
+            # A number run is the price when it carries a scale, a currency, or ends the item
+            if any(t in SCALES for t in tokens[i:end]) or trailing in CURRENCY or trailing is None:
+                break
+            if trailing in UNITS and name:
+                # "bia ba thùng": quantity stated after the name
+                quantity, unit, i = number, trailing, end + 1
+                confidence -= 0.1
+                continue
+            confidence -= 0.3
+        name.append(raw[i])
+        i += 1
+
+    price = None
+    while i < len(tokens) and tokens[i] in PRICE_MARKERS | {"đơn"}:
+        i += 1
+    if i < len(tokens) and tokens[i] in UNITS:
+        i += 1
+    if i < len(tokens):
+        price, i = _take_number(tokens, i)
+        if price is None:
+            return None, 0.0, len(tokens)
+        while i < len(tokens) and tokens[i] in CURRENCY:
+            i += 1
+        # "... một thùng" / "mỗi thùng" closing the item is a per-unit qualifier
+        if i + 1 < len(tokens) and tokens[i + 1] in UNITS and (tokens[i] in ("mỗi", "/") or (tokens[i] == "một" and i + 2 == len(tokens))):
+            i += 2
+
+    if not name:
+        return None, 0.0, len(tokens)
+    if quantity is None:
+        confidence -= 0.15
+    if unit is None:
+        confidence -= 0.05
+    if price is None:
+        confidence -= 0.25
+    elif price < 1000:
+        # "hai trăm rưỡi" is usually 250 nghìn; leave the guess to the LLM
+        confidence -= 0.4
+    if len(name) > 5:
+        confidence -= 0.3
+
+    item = {
+        "ten_hang_hoa": " ".join(name),
+        "so_luong": _to_number(quantity) if quantity is not None else 1,
+        "don_gia": int(price) if price is not None else None,
+        "don_vi_tinh": unit
+    }
+    return item, round(max(confidence, 0.0), 2), i
+
+def parse_order_text(text: str) -> Tuple[List[Dict[str, Any]], float]:
+    """Rule-based extraction into the ten_hang_hoa / so_luong / don_gia schema, with a 0..1 confidence"""
+    segments, current = [], []
+    for token in tokenize(text):
+        if token.lower() in SEPARATORS:
+            if current:
+                segments.append(current)
+            current = []
+        else:
+            current.append(token)
+    if current:
+        segments.append(current)
+
+    items, confidence = [], 1.0
+    for segment in segments:
+        i = 0
+        while i < len(segment):
+            item, item_confidence, i = _parse_item(segment, i)
+            if item is None:
+                return [], 0.0
+            items.append(item)
+            confidence = min(confidence, item_confidence)
+    if not items:
+        return [], 0.0
+    return items, confidence
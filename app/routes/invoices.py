@@ -1,10 +1,53 @@
-from fastapi import APIRouter
-from app.schemas.invoices import InvoiceRequest
-from app.services.invoice_service import generate_invoice_service
+from typing import Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, status
+from fastapi.responses import JSONResponse
+from app.core.security import get_tenant, require_tenant, bind_tenant
+from app.schemas.auth import TenantContext
+from app.schemas.invoices import InvoiceRequest, BatchInvoiceRequest
+from app.services.invoice_service import generate_invoice_service, generate_invoices_batch_service, get_invoice_pdf_service
+from app.services.invoice_jobs import invoice_job_queue
 
 router = APIRouter()
 
+# Request fields filled from the session token, mapped to the tenant attribute that carries them
+_TENANT_FIELDS = {"username": "username", "order_table_id": "table_order_id", "field_attachment_id": "upload_file_id"}
+
 @router.post("/generate-invoice")
-def generate_invoice(data: InvoiceRequest):
+async def generate_invoice(data: InvoiceRequest, tenant: Optional[TenantContext] = Depends(get_tenant)):
     """Generate invoice endpoint"""
-    return generate_invoice_service(data)
+    return await generate_invoice_service(bind_tenant(data, tenant, **_TENANT_FIELDS))
+
+@router.post("/generate-invoices/batch")
+async def generate_invoices_batch(data: BatchInvoiceRequest, tenant: Optional[TenantContext] = Depends(get_tenant)):
+    """Generate invoices for many orders of one tenant"""
+    return await generate_invoices_batch_service(bind_tenant(data, tenant, **_TENANT_FIELDS))
+
+@router.post("/invoice-jobs")
+async def create_invoice_job(data: InvoiceRequest, tenant: Optional[TenantContext] = Depends(get_tenant)):
+    """Queue invoice generation as a background job"""
+    job_id = await invoice_job_queue.submit(bind_tenant(data, tenant, **_TENANT_FIELDS))
+    return JSONResponse(
+        status_code=status.HTTP_202_ACCEPTED,
+        content={"status": "queued", "job_id": job_id, "detail": "Yêu cầu tạo hóa đơn đã được tiếp nhận"}
+    )
+
+@router.get("/invoice-jobs/{job_id}")
+async def get_invoice_job(job_id: str, tenant: Optional[TenantContext] = Depends(get_tenant)):
+    """Invoice job status endpoint"""
+    job = await invoice_job_queue.get(job_id)
+    # Another tenant's job is reported as missing
+    if job is None or (tenant is not None and job["username"] != tenant.username):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Không tìm thấy yêu cầu tạo hóa đơn")
+    return job
+
+@router.get("/invoices/{invoice_no}/pdf")
+async def get_invoice_pdf(
+    invoice_no: str,
+    template_code: Optional[str] = None,
+    range_header: Optional[str] = Header(None, alias="Range"),
+    if_none_match: Optional[str] = Header(None, alias="If-None-Match"),
+    tenant: TenantContext = Depends(require_tenant)
+):
+    """Download one of the session tenant's invoice PDFs (cached locally, supports ETag and Range requests)"""
+    # The tenant's username is its tax code, so a session can only reach its own invoices
+    return await get_invoice_pdf_service(invoice_no, tenant.username, tenant.username, template_code, range_header, if_none_match)
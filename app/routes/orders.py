@@ -1,10 +1,55 @@
-from fastapi import APIRouter
-from app.schemas.orders import CreateOrderRequest
-from app.services.order_service import create_order_service
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import JSONResponse
+from app.core.config import settings
+from app.core.security import get_tenant, bind_tenant
+from app.schemas.auth import TenantContext
+from app.schemas.orders import CreateOrderRequest, BulkCreateOrderRequest, ExportOrdersQuery
+from app.services.order_service import create_order_service, create_orders_bulk_service, export_orders_service
+from app.services.order_queue import order_queue
 
 router = APIRouter()
 
+def _bind_order(data: CreateOrderRequest, tenant: Optional[TenantContext]) -> CreateOrderRequest:
+    if tenant is not None:
+        data = data.model_copy(update={"username": tenant.username})
+    return bind_tenant(data, tenant, order_table_id="table_order_id", detail_table_id="table_order_detail_id")
+
 @router.post("/create-order")
-async def create_order(data: CreateOrderRequest):
+async def create_order(data: CreateOrderRequest, tenant: Optional[TenantContext] = Depends(get_tenant)):
     """Create new order endpoint"""
+    data = _bind_order(data, tenant)
+    if settings.ORDER_QUEUE_ENABLED:
+        local_order_id = await order_queue.enqueue(data)
+        return JSONResponse(
+            status_code=status.HTTP_202_ACCEPTED,
+            content={"status": "queued", "local_order_id": local_order_id, "detail": "Đơn hàng đã được tiếp nhận và đang chờ đồng bộ"}
+        )
     return await create_order_service(data)
+
+@router.post("/create-orders/bulk")
+async def create_orders_bulk(data: BulkCreateOrderRequest, tenant: Optional[TenantContext] = Depends(get_tenant)):
+    """Bulk order import endpoint"""
+    data = BulkCreateOrderRequest(orders=[_bind_order(order, tenant) for order in data.orders])
+    return await create_orders_bulk_service(data)
+
+@router.get("/orders/export")
+async def export_orders(
+    export_format: str = Query("ndjson", alias="format"),
+    order_table_id: Optional[str] = None,
+    detail_table_id: Optional[str] = None,
+    tenant: Optional[TenantContext] = Depends(get_tenant)
+):
+    """Stream all orders with their lines as NDJSON (one order per line) or CSV (one row per line)"""
+    query = bind_tenant(ExportOrdersQuery(order_table_id=order_table_id, detail_table_id=detail_table_id), tenant,
+                        order_table_id="table_order_id", detail_table_id="table_order_detail_id")
+    return await export_orders_service(query, export_format)
+
+@router.get("/orders/queue/{local_order_id}")
+async def get_queued_order(local_order_id: str, tenant: Optional[TenantContext] = Depends(get_tenant)):
+    """Resolve a locally queued order to its Teable record"""
+    queued = await order_queue.get(local_order_id)
+    # Another tenant's order is reported as missing
+    if queued is None or (tenant is not None and queued["username"] != tenant.username):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Không tìm thấy đơn hàng trong hàng đợi")
+    return queued
@@ -1,10 +1,18 @@
-# from fastapi import APIRouter, UploadFile, File
-# from app.services.transcription_service import transcribe_and_extract_service
+from typing import Optional
+from fastapi import APIRouter, Depends, UploadFile, File, Form, WebSocket
+from app.core.security import get_tenant
+from app.schemas.auth import TenantContext
+from app.services.transcription_service import transcribe_and_extract_service, stream_transcribe_and_extract_service
 
-# router = APIRouter()
+router = APIRouter()
 
-# @router.post("/transcribe/")
-# async def transcribe_and_extract(file: UploadFile = File(...)):
-#     """Transcribe audio file and extract order information"""
-#     file_content = await file.read()
-#     return await transcribe_and_extract_service(file_content)
+@router.post("/transcribe/")
+async def transcribe_and_extract(file: UploadFile = File(...), username: Optional[str] = Form(None),
+                                 tenant: Optional[TenantContext] = Depends(get_tenant)):
+    """Transcribe audio file and extract order information"""
+    return await transcribe_and_extract_service(file, tenant.username if tenant is not None else username)
+
+@router.websocket("/ws/transcribe")
+async def transcribe_stream(websocket: WebSocket):
+    """Stream 16 kHz mono 16-bit PCM audio as binary messages, then send "end" to get the extracted order (?token= session token for the tenant)"""
+    await stream_transcribe_and_extract_service(websocket)
@@ -7,3 +7,10 @@ class Account(BaseModel):
 class SignUp(BaseModel):
     username: str  # This will be used as taxcode
     password: str
+
+class TenantContext(BaseModel):
+    """Tenant identity carried by a verified session token"""
+    username: str
+    table_order_id: str = ""
+    table_order_detail_id: str = ""
+    upload_file_id: str = ""
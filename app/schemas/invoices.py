@@ -1,9 +1,20 @@
 from pydantic import BaseModel
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional
 
 class InvoiceRequest(BaseModel):
-    username: str
-    order_table_id: str
+    # username, order_table_id and field_attachment_id are filled from the session token when one is sent
+    username: Optional[str] = None
+    order_table_id: Optional[str] = None
     record_order_id: str
-    field_attachment_id: str
+    field_attachment_id: Optional[str] = None
     invoice_payload: Dict[str, Any]  # Will be automatically populated with invoice config
+
+class BatchInvoiceItem(BaseModel):
+    record_order_id: str
+    invoice_payload: Dict[str, Any]
+
+class BatchInvoiceRequest(BaseModel):
+    username: Optional[str] = None
+    order_table_id: Optional[str] = None
+    field_attachment_id: Optional[str] = None
+    invoices: List[BatchInvoiceItem]
@@ -1,16 +1,29 @@
 from pydantic import BaseModel
-from typing import List
+from typing import List, Optional
 
 class OrderDetail(BaseModel):
     product_name: str
     unit_price: float
     quantity: int
     vat: float
-    temp_total: float
-    final_total: float
+    # Line totals are computed server-side; client-supplied values are ignored
+    temp_total: Optional[float] = None
+    final_total: Optional[float] = None
+    # Unit conversion record; when set, its price and VAT from the tenant's catalog take precedence
+    unit_id: Optional[str] = None
 
 class CreateOrderRequest(BaseModel):
     customer_name: str
     order_details: List[OrderDetail]
-    order_table_id: str
-    detail_table_id: str
+    # Filled from the session token when one is sent
+    order_table_id: Optional[str] = None
+    detail_table_id: Optional[str] = None
+    username: Optional[str] = None
+
+class BulkCreateOrderRequest(BaseModel):
+    orders: List[CreateOrderRequest]
+
+class ExportOrdersQuery(BaseModel):
+    # Filled from the session token when one is sent
+    order_table_id: Optional[str] = None
+    detail_table_id: Optional[str] = None
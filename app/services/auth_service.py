@@ -1,32 +1,28 @@
 import json
-import requests
+import asyncio
 import base64
+import hmac
 import logging
-from datetime import datetime
 from fastapi import HTTPException, status
 from app.core.config import settings
-from app.services.teable_service import handle_teable_api_call, create_table, update_user_table_id
-from app.schemas.auth import Account, SignUp
+from app.core.http_client import get_teable_client
+from app.core.security import create_session_token
+from app.services.teable_service import handle_teable_api_call, update_user_table_id, get_user_record
+from app.services.provisioning_service import (
+    provision_workspace, is_provisioned, PROGRESS_FIELDS, PROVISIONING_IN_PROGRESS, PROVISIONING_COMPLETED
+)
+from app.services.workspace_pool import workspace_pool, rename_workspace
+from app.services.last_login import last_login_buffer
+from app.services.taxcode_lookup import taxcode_lookup
+from app.schemas.auth import Account, SignUp, TenantContext
 
 logger = logging.getLogger(__name__)
 
 async def signin_service(account: Account) -> dict:
     """Handle user signin"""
     try:
-        teable_url = f"{settings.TEABLE_BASE_URL}/table/{settings.TEABLE_TABLE_ID}/record"
-        headers = {"Authorization": settings.TEABLE_TOKEN, "Accept": "application/json"}
-        params = {
-            "fieldKeyType": "dbFieldName",
-            "filter": json.dumps({
-                "conjunction": "and",
-                "filterSet": [
-                    {"fieldId": "username", "operator": "is", "value": account.username},
-                    {"fieldId": "password", "operator": "is", "value": account.password}
-                ]
-            })
-        }
-
-        result = handle_teable_api_call("GET", teable_url, params=params, headers=headers)
+        # Credentials are always checked against Teable so a changed password takes effect at once
+        result = await get_user_record(account.username, fresh=True)
 
         if not result["success"]:
             raise HTTPException(
@@ -34,31 +30,32 @@ async def signin_service(account: Account) -> dict:
                 detail=result.get("error", "Không thể xác thực người dùng")
             )
 
-        records = result.get("data", {}).get("records", [])
-        if not records:
+        user_record = result["record"]
+        stored_password = (user_record or {}).get("fields", {}).get("password") or ""
+        if not user_record or not hmac.compare_digest(stored_password.encode("utf-8"), account.password.encode("utf-8")):
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Tên người dùng hoặc mật khẩu không hợp lệ"
             )
+        records = [user_record]
 
-        # Update last_login field with current datetime
-        user_record = records[0]
-        record_id = user_record["id"]
-        current_datetime = datetime.now().isoformat()
+        # Record the login time; it is written to Teable in the background
+        last_login_buffer.record(user_record["id"])
 
-        update_fields = {
-            "last_login": current_datetime
-        }
-
-        # Update the user record with last login time
-        update_success = update_user_table_id(settings.TEABLE_TABLE_ID, record_id, update_fields)
-        if not update_success:
-            # Log the error but don't fail the signin process
-            logger.warning(f"Failed to update last_login for user {account.username}")
+        # Session token carrying the tenant's tables, verified locally by later requests
+        fields = user_record.get("fields", {})
+        session_token = create_session_token(TenantContext(
+            username=account.username,
+            table_order_id=fields.get("table_order_id") or "",
+            table_order_detail_id=fields.get("table_order_detail_id") or "",
+            upload_file_id=fields.get("upload_file_id") or ""
+        ))
 
         return {
             "status": "success",
             "accessToken": settings.TEABLE_TOKEN.replace("Bearer ", ""),
+            "sessionToken": session_token,
+            "expiresIn": int(settings.SESSION_TTL),
             "detail": "Xác thực thành công",
             "record": records
         }
@@ -71,138 +68,70 @@ async def signin_service(account: Account) -> dict:
             detail=f"Lỗi máy chủ không mong muốn: {str(e)}"
         )
 
+async def lookup_business_name(taxcode: str) -> str:
+    """Validate a taxcode with the VietQR API and return the business name"""
+    return await taxcode_lookup.lookup(taxcode)
+
 async def signup_service(account: SignUp) -> dict:
     """Handle user signup"""
     try:
-        # Step 1: Validate taxcode and get business information from VietQR API
         taxcode = account.username
-        vietqr_url = f"https://api.vietqr.io/v2/business/{taxcode}"
-
-        try:
-            vietqr_response = requests.get(vietqr_url)
-            vietqr_response.raise_for_status()
-            vietqr_data = vietqr_response.json()
-
-            if vietqr_data.get("code") != "00":
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail="Mã số thuế không tồn tại hoặc không hợp lệ"
-                )
-
-            business_name = vietqr_data["data"]["name"]
-            logger.info(f"Found business: {business_name} for taxcode: {taxcode}")
-
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Error calling VietQR API: {str(e)}")
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="Không thể xác minh mã số thuế. Vui lòng thử lại sau"
-            )
-        except HTTPException:
-            raise
-        except Exception as e:
-            logger.error(f"Unexpected error validating taxcode: {str(e)}")
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="Lỗi không mong muốn khi xác minh mã số thuế"
-            )
-
-        # Step 2: Check if username already exists in Teable
         headers = {"Authorization": settings.TEABLE_TOKEN, "Accept": "application/json", "Content-Type": "application/json"}
         teable_url = f"{settings.TEABLE_BASE_URL}/table/{settings.TEABLE_TABLE_ID}/record"
 
+        # Step 1 & 2: Validate taxcode with VietQR and check for an existing account concurrently
         params_check = {
             "fieldKeyType": "dbFieldName",
             "filter": json.dumps({"conjunction": "and", "filterSet": [{"fieldId": "username", "operator": "is", "value": account.username}]})
         }
-        check_result = handle_teable_api_call("GET", teable_url, params=params_check, headers=headers)
+        business_name, check_result = await asyncio.gather(
+            lookup_business_name(taxcode),
+            handle_teable_api_call("GET", teable_url, params=params_check, headers=headers)
+        )
         if not check_result["success"]:
             return {"status": "error", "detail": f"Không thể kiểm tra tài khoản đã tồn tại: {check_result['error']}", "status_code": check_result.get("status_code")}
-        if check_result["data"].get("records"):
-            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Tài khoản với mã số thuế này đã tồn tại")
 
-        # Step 3: Create user account with business_name from VietQR API
-        create_user_payload = {
-            "fieldKeyType": "dbFieldName",
-            "typecast": True,
-            "records": [{"fields": {"username": account.username, "password": account.password, "business_name": business_name}}]
-        }
-        response_account = requests.post(teable_url, data=json.dumps(create_user_payload), headers=headers)
-        if response_account.status_code != 201:
-            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Không thể tạo tài khoản")
-
-        record_id = response_account.json()["records"][0]["id"]
-
-        # Step 4: Create space and base with business name
-        space_name = f"{business_name}_workspace"
-        base_name = f"{business_name}_database"
-
-        space_id = requests.post(f"{settings.TEABLE_BASE_URL}/space", data=json.dumps({"name": space_name}), headers=headers).json()["id"]
-        base_id = requests.post(f"{settings.TEABLE_BASE_URL}/base", data=json.dumps({"spaceId": space_id, "name": base_name, "icon": "📊"}), headers=headers).json()["id"]
-
-        # Create detail table
-        detail_table_id = create_table(base_id, {"name": "Chi Tiết Hoá Đơn", "description": "Chi tiết đơn hàng", "icon": "🧾", "fields": [
-            {"type": "autoNumber", "name": "Số đơn hàng chi tiết", "dbFieldName": "number_order_detail"},
-            {"type": "longText", "name": "Tên Hàng Hoá", "dbFieldName": "product_name"},
-            {"type": "number", "name": "Đơn Giá", "dbFieldName": "unit_price"},
-            {"type": "number", "name": "Số Lượng", "dbFieldName": "quantity"},
-            {"type": "number", "name": "VAT", "dbFieldName": "vat"},
-            {"type": "number", "name": "Tạm Tính", "dbFieldName": "temp_total"},
-            {"type": "number", "name": "Thành Tiền", "dbFieldName": "final_total"}
-        ], "fieldKeyType": "dbFieldName", "records": []}, headers)
-        if not detail_table_id:
-            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Không thể tạo bảng chi tiết đơn hàng")
-
-        # Create order table and get the invoice_file field ID
-        order_table_payload = {"name": "Đơn Hàng", "description": "Bảng lưu thông tin các đơn hàng", "icon": "📦", "fields": [
-            {"type": "formula", "name": "Số đơn hàng", "dbFieldName": "order_number", "options": {"expression": "concatenate('DH-', DATETIME_FORMAT(CREATED_TIME(), 'DDMMYYYY'), '-', AUTO_NUMBER())"}},
-            {"type": "longText", "name": "Tên Khách Hàng", "dbFieldName": "customer_name"},
-            {"type": "link", "name": "Chi Tiết Hóa Đơn", "dbFieldName": "invoice_details", "options": {"foreignTableId": detail_table_id, "relationship": "oneMany"}},
-            {"type": "checkbox", "name": "Xuất hoá đơn", "dbFieldName": "invoice_state"},
-            {"type": "number", "name": "Tổng Tạm Tính", "dbFieldName": "total_temp"},
-            {"type": "number", "name": "Tổng VAT", "dbFieldName": "total_vat"},
-            {"type": "number", "name": "Tổng Sau VAT", "dbFieldName": "total_after_vat"},
-            {"type": "singleLineText", "name": "Mã hoá đơn", "dbFieldName": "invoice_code"},
-            {"type": "attachment", "name": "File hoá đơn", "dbFieldName": "invoice_file"}
-        ], "fieldKeyType": "dbFieldName", "records": []}
-
-        # Create order table and get full response to extract field IDs
-        order_table_url = f"{settings.TEABLE_BASE_URL}/base/{base_id}/table/"
-        order_table_response = requests.post(order_table_url, data=json.dumps(order_table_payload), headers=headers)
-        if order_table_response.status_code != 201:
-            logger.error(f"Không thể tạo bảng đơn hàng: {order_table_response.text}")
-            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Không thể tạo bảng đơn hàng")
-
-        order_table_data = order_table_response.json()
-        order_table_id = order_table_data["id"]
-
-        # Find the invoice_file field ID
-        upload_file_id = None
-        for field in order_table_data.get("fields", []):
-            if field.get("dbFieldName") == "invoice_file":
-                upload_file_id = field.get("id")
-                break
-
-        if not upload_file_id:
-            logger.warning("Could not find invoice_file field ID in order table")
-            upload_file_id = ""
-
-        # Create invoice info table
-        invoice_info_table_id = create_table(base_id, {
-            "name": "Invoice Table",
-            "dbTableName": "invoice_table",
-            "description": "Bảng lưu thông tin hóa đơn",
-            "icon": "🧾",
-            "fields": [
-                {"type": "singleLineText", "name": "Mã Hóa Đơn", "dbFieldName": "invoice_template", "description": "Trường mẫu chính", "unique": True},
-                {"type": "singleLineText", "name": "Mã Mẫu", "dbFieldName": "template_code", "description": "Mã mẫu chính"},
-                {"type": "multipleSelect", "name": "Sê-ri Hóa Đơn", "dbFieldName": "invoice_series", "description": "Nhiều sê-ri hóa đơn"}
-            ],
-            "fieldKeyType": "dbFieldName",
-            "records": []
-        }, headers)
-        if not invoice_info_table_id:
-            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Không thể tạo bảng mẫu hóa đơn")
+        existing_records = check_result["data"].get("records", [])
+        if existing_records:
+            # Resume a signup that failed halfway, as long as the same credentials are used
+            existing = existing_records[0]
+            fields = existing.get("fields", {})
+            stored_password = fields.get("password") or ""
+            if is_provisioned(fields) or not hmac.compare_digest(stored_password.encode("utf-8"), account.password.encode("utf-8")):
+                raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Tài khoản với mã số thuế này đã tồn tại")
+            record_id = existing["id"]
+            progress = {key: fields[key] for key in PROGRESS_FIELDS if fields.get(key)}
+            logger.info(f"Resuming provisioning for {account.username} with completed steps: {list(progress)}")
+        else:
+            # Step 3: Create user account with business_name from VietQR API
+            create_user_payload = {
+                "fieldKeyType": "dbFieldName",
+                "typecast": True,
+                "records": [{"fields": {
+                    "username": account.username,
+                    "password": account.password,
+                    "business_name": business_name,
+                    "provisioning_state": PROVISIONING_IN_PROGRESS
+                }}]
+            }
+            response_account = await get_teable_client().post(teable_url, json=create_user_payload, headers=headers)
+            if response_account.status_code != 201:
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Không thể tạo tài khoản")
+
+            record_id = response_account.json()["records"][0]["id"]
+            progress = {}
+
+        # Step 4: Claim a pre-provisioned workspace, or create space, base and tables in parallel
+        pooled = workspace_pool.claim() if not progress else None
+        if pooled:
+            logger.info(f"Claimed pooled workspace {pooled['space_id']} for {account.username}")
+            await asyncio.gather(
+                rename_workspace(pooled["space_id"], pooled["base_id"], business_name),
+                update_user_table_id(settings.TEABLE_TABLE_ID, record_id, pooled)
+            )
+            ctx = {**pooled, "business_name": business_name}
+        else:
+            ctx = await provision_workspace(record_id, {**progress, "business_name": business_name})
 
         # Create invoice token
         raw_string = f"{account.username}:{account.password}"
@@ -211,13 +140,16 @@ async def signup_service(account: SignUp) -> dict:
 
         # Update user record with table IDs and upload file field ID
         update_fields = {
-            "table_order_detail_id": detail_table_id,
-            "table_order_id": order_table_id,
-            "table_invoice_info_id": invoice_info_table_id,
+            "space_id": ctx["space_id"],
+            "base_id": ctx["base_id"],
+            "table_order_detail_id": ctx["table_order_detail_id"],
+            "table_order_id": ctx["table_order_id"],
+            "table_invoice_info_id": ctx["table_invoice_info_id"],
             "invoice_token": encoded_str,
-            "upload_file_id": upload_file_id
+            "upload_file_id": ctx.get("upload_file_id", ""),
+            "provisioning_state": PROVISIONING_COMPLETED
         }
-        if not update_user_table_id(settings.TEABLE_TABLE_ID, record_id, update_fields):
+        if not await update_user_table_id(settings.TEABLE_TABLE_ID, record_id, update_fields):
             raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Tài khoản đã được tạo, nhưng không thể cập nhật với các ID bảng")
 
         return {
@@ -226,10 +158,10 @@ async def signup_service(account: SignUp) -> dict:
             "account_id": record_id,
             "business_name": business_name,
             "taxcode": taxcode,
-            "table_order_id": order_table_id,
-            "table_order_detail_id": detail_table_id,
-            "table_invoice_info_id": invoice_info_table_id,
-            "upload_file_id": upload_file_id
+            "table_order_id": ctx["table_order_id"],
+            "table_order_detail_id": ctx["table_order_detail_id"],
+            "table_invoice_info_id": ctx["table_invoice_info_id"],
+            "upload_file_id": ctx.get("upload_file_id", "")
         }
 
     except HTTPException:
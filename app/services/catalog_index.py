@@ -0,0 +1,254 @@
+import json
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+from app.core.config import settings
+from app.services.teable_service import get_user_record, iter_records
+from app.utils.trigram import TrigramIndex, fold
+
+logger = logging.getLogger(__name__)
+
+def _link_ids(value: Any) -> List[str]:
+    """Record IDs from a Teable link field, which is an object or a list of objects"""
+    if not value:
+        return []
+    links = value if isinstance(value, list) else [value]
+    return [link["id"] for link in links if isinstance(link, dict) and link.get("id")]
+
+def _signature(fields: dict) -> str:
+    return json.dumps(fields, sort_keys=True, ensure_ascii=False, default=str)
+
+class TenantCatalog:
+    """One tenant's products and unit conversions, indexed for fuzzy name lookup"""
+
+    def __init__(self, product_table_id: str, unit_table_id: Optional[str]):
+        self.product_table_id = product_table_id
+        self.unit_table_id = unit_table_id
+        self.products: Dict[str, Dict[str, Any]] = {}
+        self.units: Dict[str, Dict[str, Any]] = {}
+        self.synced_at = 0.0
+        self.units_version = 0
+        self._units_signature = ""
+        self._signatures: Dict[str, str] = {}
+        self._index = TrigramIndex()
+
+    def apply_products(self, records: List[dict]) -> int:
+        """Bring the product index in line with a full listing, touching only changed records"""
+        changed, seen = 0, set()
+        for record in records:
+            record_id, fields = record["id"], record.get("fields", {})
+            seen.add(record_id)
+            signature = _signature(fields)
+            if self._signatures.get(record_id) == signature:
+                continue
+            self._signatures[record_id] = signature
+            name = str(fields.get("product_name") or "").strip()
+            self.products[record_id] = {"id": record_id, "name": name, "unit_ids": _link_ids(fields.get("unit_conversions"))}
+            self._index.add(record_id, name)
+            changed += 1
+        for record_id in set(self.products) - seen:
+            self.products.pop(record_id)
+            self._signatures.pop(record_id, None)
+            self._index.remove(record_id)
+            changed += 1
+        return changed
+
+    def apply_units(self, records: List[dict]) -> None:
+        signature = _signature([[record["id"], record.get("fields", {})] for record in records])
+        if signature == self._units_signature:
+            return
+        self._units_signature = signature
+        self.units_version += 1
+        units = {}
+        for record in records:
+            fields = record.get("fields", {})
+            name = str(fields.get("name_unit") or "").strip()
+            units[record["id"]] = {
+                "id": record["id"],
+                "name": name,
+                "folded": fold(name),
+                "conversion_factor": fields.get("conversion_factor"),
+                "unit_default": fields.get("unit_default"),
+                "price": fields.get("price"),
+                "vat": fields.get("vat")
+            }
+        self.units = units
+
+    def _pick_unit(self, product: Dict[str, Any], unit_name: Optional[str]) -> Optional[Dict[str, Any]]:
+        units = [self.units[unit_id] for unit_id in product["unit_ids"] if unit_id in self.units]
+        if not units:
+            return None
+        if unit_name:
+            folded = fold(unit_name)
+            for unit in units:
+                if unit["folded"] == folded:
+                    return unit
+            return None
+        # Without a spoken unit, use the base unit (conversion factor 1) or the first one linked
+        return next((unit for unit in units if unit["conversion_factor"] in (1, 1.0)), units[0])
+
+    def match(self, name: str, unit_name: Optional[str], threshold: float) -> Optional[Dict[str, Any]]:
+        found = self._index.best(name, threshold)
+        if found is None:
+            return None
+        product_id, score = found
+        product = self.products[product_id]
+        return {"product": product, "unit": self._pick_unit(product, unit_name), "score": round(score, 3)}
+
+class CatalogIndex:
+    """Per-tenant in-memory catalog indexes, loaded from Teable on first use and refreshed in the background"""
+
+    def __init__(self, refresh_interval: float, max_tenants: int, threshold: float):
+        self.refresh_interval = refresh_interval
+        self.max_tenants = max_tenants
+        self.threshold = threshold
+        self.matched = 0
+        self.unmatched = 0
+        self._tenants: "OrderedDict[str, TenantCatalog]" = OrderedDict()
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._warming: Dict[str, asyncio.Task] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    async def _sync(self, catalog: TenantCatalog) -> None:
+        products = [record async for record in iter_records(catalog.product_table_id)]
+        units = [record async for record in iter_records(catalog.unit_table_id)] if catalog.unit_table_id else []
+        catalog.apply_units(units)
+        changed = catalog.apply_products(products)
+        catalog.synced_at = time.time()
+        if changed:
+            logger.info(f"Catalog {catalog.product_table_id} synced: {changed} products changed")
+
+    async def _load(self, username: str) -> Optional[TenantCatalog]:
+        result = await get_user_record(username)
+        fields = (result.get("record") or {}).get("fields", {}) if result["success"] else {}
+        product_table_id = fields.get("table_product_id")
+        if not product_table_id:
+            return None
+        catalog = TenantCatalog(product_table_id, fields.get("table_unit_conversions_id"))
+        await self._sync(catalog)
+        return catalog
+
+    async def get(self, username: str) -> Optional[TenantCatalog]:
+        """Return the tenant's catalog, loading it once when first needed"""
+        catalog = self._tenants.get(username)
+        if catalog is None:
+            async with self._locks.setdefault(username, asyncio.Lock()):
+                catalog = self._tenants.get(username)
+                if catalog is None:
+                    catalog = await self._load(username)
+                    if catalog is None:
+                        return None
+                    self._tenants[username] = catalog
+                    while len(self._tenants) > self.max_tenants:
+                        evicted, _ = self._tenants.popitem(last=False)
+                        self._locks.pop(evicted, None)
+        self._tenants.move_to_end(username)
+        return catalog
+
+    def peek(self, username: str) -> Optional[TenantCatalog]:
+        """Return the tenant's catalog only if it is already loaded"""
+        catalog = self._tenants.get(username)
+        if catalog is not None:
+            self._tenants.move_to_end(username)
+        return catalog
+
+    async def _warm(self, username: str) -> None:
+        try:
+            await self.get(username)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Không thể tải danh mục sản phẩm của {username}: {str(e)}")
+        finally:
+            self._warming.pop(username, None)
+
+    def warm(self, username: str) -> None:
+        """Load the tenant's catalog in the background, once at a time per tenant"""
+        if username not in self._tenants and username not in self._warming:
+            self._warming[username] = asyncio.create_task(self._warm(username))
+
+    async def refresh(self, username: str) -> None:
+        """Resync a tenant's catalog now, e.g. after its products were edited"""
+        catalog = self._tenants.get(username)
+        if catalog is not None:
+            await self._sync(catalog)
+
+    async def enrich(self, username: Optional[str], items: Any) -> Any:
+        """Fill in product and unit links and default prices on extracted items"""
+        if not username or not isinstance(items, list):
+            return items
+        try:
+            catalog = await self.get(username)
+        except Exception as e:
+            logger.error(f"Không thể tải danh mục sản phẩm của {username}: {str(e)}")
+            return items
+        if catalog is None:
+            return items
+
+        enriched = []
+        for item in items:
+            # The LLM occasionally returns strings or nulls in the array; pass them through untouched
+            if not isinstance(item, dict):
+                enriched.append(item)
+                continue
+            match = catalog.match(str(item.get("ten_hang_hoa") or ""), item.get("don_vi_tinh"), self.threshold)
+            if match is None:
+                self.unmatched += 1
+                enriched.append(item)
+                continue
+            self.matched += 1
+            item = {**item, "product_id": match["product"]["id"], "product_name": match["product"]["name"], "match_score": match["score"]}
+            unit = match["unit"]
+            if unit is not None:
+                item.update({"unit_id": unit["id"], "don_vi_tinh": unit["name"]})
+                # Keep the extracted VAT unless the catalog has one
+                if unit["vat"] is not None:
+                    item["vat"] = unit["vat"]
+                if item.get("don_gia") is None:
+                    item["don_gia"] = unit["price"]
+            enriched.append(item)
+        return enriched
+
+    async def _refresh_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            for username, catalog in list(self._tenants.items()):
+                try:
+                    await self._sync(catalog)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.error(f"Không thể đồng bộ danh mục sản phẩm của {username}: {str(e)}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "tenants": len(self._tenants),
+            "products": sum(len(c.products) for c in self._tenants.values()),
+            "matched": self.matched,
+            "unmatched": self.unmatched
+        }
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self) -> None:
+        for task in list(self._warming.values()):
+            task.cancel()
+        await asyncio.gather(*self._warming.values(), return_exceptions=True)
+        self._warming.clear()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+catalog_index = CatalogIndex(
+    refresh_interval=settings.CATALOG_REFRESH_INTERVAL,
+    max_tenants=settings.CATALOG_MAX_TENANTS,
+    threshold=settings.CATALOG_MATCH_THRESHOLD
+)
@@ -0,0 +1,133 @@
+import os
+import json
+import time
+import asyncio
+import logging
+import unicodedata
+from typing import Any, Dict, List, Optional
+from app.core.config import settings
+from app.order_parser import tokenize, is_number_token, parse_number
+from app.utils.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# Old-style tone placement ("hoà", "thuý") mapped to the new style ("hòa", "thúy")
+_TONE_PLACEMENT = {
+    "oà": "òa", "oá": "óa", "oả": "ỏa", "oã": "õa", "oạ": "ọa",
+    "oè": "òe", "oé": "óe", "oẻ": "ỏe", "oẽ": "õe", "oẹ": "ọe",
+    "uỳ": "ùy", "uý": "úy", "uỷ": "ủy", "uỹ": "ũy", "uỵ": "ụy",
+}
+_SYNONYMS = {"ngàn": "nghìn", "tỉ": "tỷ", "đ": "đồng", "vnđ": "đồng", "vnd": "đồng", "ký": "kg", "kí": "kg"}
+
+def normalize_transcript(text: str) -> str:
+    """Canonical form of a transcript: NFC, lowercase, one tone-mark style, punctuation-free, numbers as digits"""
+    text = unicodedata.normalize("NFC", text).lower()
+    for old, new in _TONE_PLACEMENT.items():
+        text = text.replace(old, new)
+
+    words: List[str] = []
+    run: List[str] = []
+
+    def flush_run() -> None:
+        if run:
+            value = parse_number(run)
+            words.append(format(value.normalize(), "f") if value is not None else " ".join(run))
+            run.clear()
+
+    for token in tokenize(text):
+        token = _SYNONYMS.get(token, token)
+        if is_number_token(token):
+            run.append(token)
+            continue
+        flush_run()
+        # Whisper punctuates inconsistently, so punctuation is not part of the key
+        if token[0].isalnum():
+            words.append(token)
+    flush_run()
+    return " ".join(words)
+
+def is_valid_extraction(result: Any) -> bool:
+    return (isinstance(result, list) and bool(result) and
+            all(isinstance(item, dict) and item.get("ten_hang_hoa") for item in result))
+
+class ExtractionCache:
+    """Validated extraction results keyed by normalized transcript, with TTL, LRU and an optional JSON snapshot"""
+
+    def __init__(self, maxsize: int, ttl: float, path: Optional[str] = None, save_interval: float = 60.0):
+        self.path = path
+        self.save_interval = save_interval
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._dirty = False
+        self._task: Optional[asyncio.Task] = None
+
+    def get(self, text: str) -> Optional[List[Dict[str, Any]]]:
+        return self._cache.get(normalize_transcript(text))
+
+    def set(self, text: str, result: Any) -> None:
+        """Store a result; error results and malformed arrays are never cached"""
+        if not is_valid_extraction(result):
+            return
+        self._cache.set(normalize_transcript(text), result)
+        self._dirty = True
+
+    def _load(self) -> None:
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logger.error(f"Không thể đọc bộ nhớ đệm trích xuất: {str(e)}")
+            return
+        now = time.time()
+        for key, value, expires_at in entries:
+            if expires_at > now:
+                self._cache.set(key, value, ttl=expires_at - now)
+
+    def _save(self) -> None:
+        now = time.time()
+        entries = [[key, value, now + remaining] for key, value, remaining in self._cache.items()]
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(entries, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    async def _save_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.save_interval)
+            if self._dirty:
+                self._dirty = False
+                try:
+                    await asyncio.to_thread(self._save)
+                except OSError as e:
+                    logger.error(f"Không thể lưu bộ nhớ đệm trích xuất: {str(e)}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self._cache.stats(), "persistent": bool(self.path)}
+
+    def start(self) -> None:
+        """Load the snapshot left by the previous process and start periodic saving"""
+        if self.path and self._task is None:
+            self._load()
+            self._task = asyncio.create_task(self._save_loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            try:
+                self._save()
+            except OSError as e:
+                logger.error(f"Không thể lưu bộ nhớ đệm trích xuất: {str(e)}")
+
+extraction_cache = ExtractionCache(
+    maxsize=settings.EXTRACTION_CACHE_MAXSIZE,
+    ttl=settings.EXTRACTION_CACHE_TTL,
+    path=settings.EXTRACTION_CACHE_PATH or None,
+    save_interval=settings.EXTRACTION_CACHE_SAVE_INTERVAL
+)
@@ -0,0 +1,207 @@
+import json
+import time
+import uuid
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional, Set
+from fastapi import HTTPException
+from app.core.config import settings
+from app.schemas.invoices import InvoiceRequest
+from app.services.invoice_service import (
+    get_invoice_config, create_invoice, fetch_invoice_pdf, attach_invoice_to_order, mark_order_invoiced
+)
+from app.utils.sqlite_store import SQLiteStore
+
+logger = logging.getLogger(__name__)
+
+INVOICE_JOBS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS invoice_jobs (
+    id TEXT PRIMARY KEY,
+    username TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    stage TEXT NOT NULL DEFAULT 'queued',
+    invoice_no TEXT,
+    supplier_tax_code TEXT,
+    result TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_invoice_jobs_status ON invoice_jobs (status);
+"""
+
+JOB_COLUMNS = ("id", "username", "payload", "status", "stage", "invoice_no", "supplier_tax_code", "result", "error", "created_at", "updated_at")
+
+# Stages after which the PDF is already attached to the order, so a resumed job must not upload it again
+_ATTACHED_STAGES = ("update_order", "done")
+
+class InvoiceJobQueue:
+    """Runs invoice generation as persistent background jobs: a fixed pool of workers pulls jobs from SQLite,
+    with a global cap (the pool size) and a per-tenant cap"""
+
+    def __init__(self, path: str, workers: int = 8, per_tenant: int = 2):
+        self.workers = workers
+        self.per_tenant = per_tenant
+        self._store = SQLiteStore(path, INVOICE_JOBS_SCHEMA)
+        self._running: Dict[str, int] = {}
+        self._claim_lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._tasks: Set[asyncio.Task] = set()
+        self._started = False
+
+    def _load(self, job_id: str) -> Optional[Dict[str, Any]]:
+        rows = self._store.execute(f"SELECT {', '.join(JOB_COLUMNS)} FROM invoice_jobs WHERE id = ?", (job_id,))
+        return dict(zip(JOB_COLUMNS, rows[0])) if rows else None
+
+    def _update(self, job_id: str, **fields: Any) -> None:
+        fields["updated_at"] = time.time()
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        self._store.execute(f"UPDATE invoice_jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+
+    def _insert(self, data: InvoiceRequest) -> str:
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        self._store.execute(
+            "INSERT INTO invoice_jobs (id, username, payload, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+            (job_id, data.username, data.model_dump_json(), now, now)
+        )
+        return job_id
+
+    async def submit(self, data: InvoiceRequest) -> str:
+        """Persist an invoice job and wake a worker, returning the job ID"""
+        job_id = await asyncio.to_thread(self._insert, data)
+        self._wakeup.set()
+        return job_id
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Return the public view of a job: stage, result or error"""
+        job = await asyncio.to_thread(self._load, job_id)
+        if job is None:
+            return None
+        return {
+            "job_id": job["id"],
+            "username": job["username"],
+            "status": job["status"],
+            "stage": job["stage"],
+            "result": json.loads(job["result"]) if job["result"] else None,
+            "error": job["error"],
+            "created_at": job["created_at"],
+            "updated_at": job["updated_at"]
+        }
+
+    def _claim(self, busy_tenants: List[str]) -> Optional[tuple]:
+        """Mark the oldest queued job of a tenant below its cap as running"""
+        placeholders = ", ".join("?" for _ in busy_tenants)
+        exclude = f"AND username NOT IN ({placeholders}) " if busy_tenants else ""
+        with self._store.transaction() as conn:
+            row = conn.execute(
+                f"SELECT id, username FROM invoice_jobs WHERE status = 'queued' {exclude}ORDER BY created_at LIMIT 1",
+                tuple(busy_tenants)
+            ).fetchone()
+            if row is not None:
+                conn.execute("UPDATE invoice_jobs SET status = 'running', updated_at = ? WHERE id = ?", (time.time(), row[0]))
+        return row
+
+    async def _next_job(self) -> tuple:
+        while True:
+            async with self._claim_lock:
+                busy = [username for username, count in self._running.items() if count >= self.per_tenant]
+                row = await asyncio.to_thread(self._claim, busy)
+                if row is not None:
+                    self._running[row[1]] = self._running.get(row[1], 0) + 1
+                    return row
+                self._wakeup.clear()
+            await self._wakeup.wait()
+
+    async def _worker(self) -> None:
+        while True:
+            job_id, username = await self._next_job()
+            try:
+                await self._run(job_id)
+            finally:
+                self._running[username] -= 1
+                if not self._running[username]:
+                    del self._running[username]
+                # A tenant slot was freed, so jobs skipped for that tenant may now be claimable
+                self._wakeup.set()
+
+    async def _run(self, job_id: str) -> None:
+        try:
+            await self._run_pipeline(job_id)
+        except asyncio.CancelledError:
+            raise
+        except HTTPException as e:
+            await asyncio.to_thread(self._update, job_id, status="failed", error=str(e.detail))
+        except Exception as e:
+            logger.error(f"Invoice job {job_id} failed unexpectedly: {str(e)}")
+            await asyncio.to_thread(self._update, job_id, status="failed", error=f"Lỗi không mong muốn: {str(e)}")
+
+    async def _set_stage(self, job_id: str, stage: str, **fields: Any) -> None:
+        await asyncio.to_thread(self._update, job_id, status="running", stage=stage, **fields)
+
+    async def _run_pipeline(self, job_id: str) -> None:
+        job = await asyncio.to_thread(self._load, job_id)
+        data = InvoiceRequest.model_validate_json(job["payload"])
+
+        await self._set_stage(job_id, "config")
+        config = await get_invoice_config(data.username)
+
+        # A job resumed after a restart must not create the same invoice twice
+        invoice_no, supplier_tax_code = job["invoice_no"], job["supplier_tax_code"]
+        if not invoice_no:
+            await self._set_stage(job_id, "create_invoice")
+            created = await create_invoice(config, data.invoice_payload)
+            invoice_no, supplier_tax_code = created["invoice_no"], created["supplier_tax_code"]
+            await asyncio.to_thread(self._update, job_id, invoice_no=invoice_no, supplier_tax_code=supplier_tax_code)
+
+        # ...nor upload the PDF to the order again
+        if job["stage"] in _ATTACHED_STAGES and job["result"]:
+            result = json.loads(job["result"])
+        else:
+            await self._set_stage(job_id, "fetch_pdf")
+            pdf = await fetch_invoice_pdf(config, supplier_tax_code, invoice_no)
+
+            await self._set_stage(job_id, "upload_attachment")
+            await attach_invoice_to_order(data, pdf.pop("file_to_bytes"), pdf["file_name"])
+            result = {"invoice_no": invoice_no, "file_name": pdf["file_name"]}
+
+        await self._set_stage(job_id, "update_order", result=json.dumps(result))
+        await mark_order_invoiced(data, invoice_no)
+
+        await asyncio.to_thread(self._update, job_id, status="succeeded", stage="done", result=json.dumps(result), error=None)
+
+    def _count(self, status: str) -> int:
+        return self._store.execute("SELECT COUNT(*) FROM invoice_jobs WHERE status = ?", (status,))[0][0]
+
+    def stats(self) -> Dict[str, Any]:
+        if not self._started:
+            return {"enabled": False}
+        return {
+            "enabled": True,
+            "queued": self._count("queued"),
+            "in_flight": sum(self._running.values()),
+            "workers": self.workers,
+            "per_tenant": self.per_tenant
+        }
+
+    def start(self) -> None:
+        """Open the job store, requeue jobs left running by a previous process and start the workers"""
+        if self._started:
+            return
+        self._started = True
+        self._store.execute("UPDATE invoice_jobs SET status = 'queued' WHERE status = 'running'")
+        for _ in range(self.workers):
+            task = asyncio.create_task(self._worker())
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def stop(self) -> None:
+        for task in list(self._tasks):
+            task.cancel()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._store.close()
+        self._started = False
+
+invoice_job_queue = InvoiceJobQueue(settings.INVOICE_JOBS_PATH, workers=settings.INVOICE_JOB_WORKERS, per_tenant=settings.INVOICE_JOB_PER_TENANT)
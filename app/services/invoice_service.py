@@ -1,115 +1,220 @@
-import json
-import requests
-from fastapi import HTTPException
+import base64
+import asyncio
+from typing import Any, Dict, Optional
+from fastapi import HTTPException, Response
 from app.core.config import settings
-from app.services.teable_service import upload_attachment_to_teable, update_user_table_id
-from app.schemas.invoices import InvoiceRequest
-
-def generate_invoice_service(data: InvoiceRequest) -> dict:
-    """Handle invoice generation"""
-    # Step 1: Get user configuration including invoice_token and invoice config
-    url = f"{settings.TEABLE_BASE_URL}/table/{settings.TEABLE_TABLE_ID}/record"
-    params = {
-        "fieldKeyType": "dbFieldName",
-        "filter": json.dumps({"conjunction":"and","filterSet":[{"fieldId":"username","operator":"is","value":f"{data.username}"}]})
-    }
-
+from app.core.http_client import get_external_client
+from app.services.teable_service import upload_attachment_to_teable, update_user_table_id, update_records, get_user_record
+from app.services.pdf_store import pdf_store, pdf_key
+from app.schemas.invoices import InvoiceRequest, BatchInvoiceRequest, BatchInvoiceItem
+from app.utils.file_response import file_response
+
+async def get_invoice_config(username: str) -> Dict[str, Any]:
+    """Get user configuration including invoice_token and invoice config (cached per username)"""
     try:
-        teable_resp = requests.get(url, params, headers={"Authorization": settings.TEABLE_TOKEN, "Accept": "application/json"})
-        teable_resp.raise_for_status()
-        records = teable_resp.json().get("records", [])
-        if not records:
+        user_result = await get_user_record(username)
+        if not user_result["success"]:
+            raise HTTPException(status_code=user_result.get("status_code", 500), detail=user_result.get("error", "Không thể lấy thông tin tài khoản"))
+        if not user_result["record"]:
             raise HTTPException(status_code=404, detail="Không tìm thấy tài khoản trong Teable")
 
-        user_record = records[0]["fields"]
+        user_record = user_result["record"]["fields"]
         invoice_token = user_record.get("invoice_token")
         if not invoice_token:
             raise HTTPException(status_code=400, detail="Không có invoice_token trong record")
 
-        # Get invoice configuration field names and values
-        invoice_type_fieldname = user_record.get("invoice_type_fieldname", "invoiceType")
-        invoice_code_fieldname = user_record.get("invoice_code_fieldname", "templateCode")
-        invoice_series_fieldname = user_record.get("invoice_series_fieldname", "invoiceSeries")
-
-        invoice_type = user_record.get("invoice_type")
-        template_code = user_record.get("template_code")
-        invoice_series = user_record.get("invoice_series")
-
-        if not all([invoice_type, template_code, invoice_series]):
+        config = {
+            "username": username,
+            "invoice_token": invoice_token,
+            # Get invoice configuration field names and values
+            "invoice_type_fieldname": user_record.get("invoice_type_fieldname", "invoiceType"),
+            "invoice_code_fieldname": user_record.get("invoice_code_fieldname", "templateCode"),
+            "invoice_series_fieldname": user_record.get("invoice_series_fieldname", "invoiceSeries"),
+            "invoice_type": user_record.get("invoice_type"),
+            "template_code": user_record.get("template_code"),
+            "invoice_series": user_record.get("invoice_series"),
+        }
+
+        if not all([config["invoice_type"], config["template_code"], config["invoice_series"]]):
             raise HTTPException(status_code=400, detail="Thiếu thông tin cấu hình hóa đơn (invoice_type, template_code, invoice_series)")
+        return config
 
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Lỗi khi lấy thông tin cấu hình: {str(e)}")
 
-    # Step 2: Prepare invoice payload with configuration values
-    invoice_payload = data.invoice_payload.copy()
+def _invoice_headers(config: Dict[str, Any]) -> dict:
+    return {
+        "Authorization": f"Basic {config['invoice_token']}",
+        "Content-Type": "application/json"
+    }
+
+def build_invoice_payload(config: Dict[str, Any], payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Prepare invoice payload with configuration values"""
+    invoice_payload = payload.copy()
 
     # Ensure generalInvoiceInfo exists
-    if "generalInvoiceInfo" not in invoice_payload:
-        invoice_payload["generalInvoiceInfo"] = {}
+    invoice_payload["generalInvoiceInfo"] = dict(invoice_payload.get("generalInvoiceInfo") or {})
 
     # Automatically populate invoice configuration fields
-    invoice_payload["generalInvoiceInfo"][invoice_type_fieldname] = invoice_type
-    invoice_payload["generalInvoiceInfo"][invoice_code_fieldname] = template_code
-    invoice_payload["generalInvoiceInfo"][invoice_series_fieldname] = invoice_series
-
-    # Step 3: Create invoice
-    headers = {
-        "Authorization": f"Basic {invoice_token}",
-        "Content-Type": "application/json"
-    }
-
+    invoice_payload["generalInvoiceInfo"][config["invoice_type_fieldname"]] = config["invoice_type"]
+    invoice_payload["generalInvoiceInfo"][config["invoice_code_fieldname"]] = config["template_code"]
+    invoice_payload["generalInvoiceInfo"][config["invoice_series_fieldname"]] = config["invoice_series"]
+    return invoice_payload
+
+async def create_invoice(config: Dict[str, Any], payload: Dict[str, Any]) -> Dict[str, str]:
+    """Create the invoice in Viettel and return its invoice number and supplier tax code"""
+    invoice_payload = build_invoice_payload(config, payload)
     try:
-        create_response = requests.post(f"{settings.CREATE_INVOICE_URL}/{data.username}", json=invoice_payload, headers=headers)
+        create_response = await get_external_client().post(f"{settings.CREATE_INVOICE_URL}/{config['username']}", json=invoice_payload, headers=_invoice_headers(config))
         create_response.raise_for_status()
-        create_result = create_response.json()
+        result = create_response.json().get("result")
+        if not result:
+            raise HTTPException(status_code=500, detail="Không tạo được hóa đơn")
+        # The supplier tax code is the tenant's username when Viettel leaves it out
+        return {"invoice_no": result["invoiceNo"], "supplier_tax_code": result.get("supplierTaxCode") or config["username"]}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Lỗi khi tạo hóa đơn: {str(e)}")
 
-    if not create_result.get("result"):
-        raise HTTPException(status_code=500, detail="Không tạo được hóa đơn")
-
-    result = create_result["result"]
-    invoice_no = result["invoiceNo"]
-    supplier_tax_code = result["supplierTaxCode"]
-
-    # Step 4: Get PDF
+async def fetch_invoice_pdf(config: Dict[str, Any], supplier_tax_code: str, invoice_no: str) -> Dict[str, Any]:
+    """Get the invoice PDF from Viettel as {"file_to_bytes", "file_name", "stored"}"""
     pdf_payload = {
         "supplierTaxCode": supplier_tax_code,
         "invoiceNo": invoice_no,
-        "templateCode": template_code,  # Use template_code from user configuration
+        "templateCode": config["template_code"],  # Use template_code from user configuration
         "fileType": "pdf"
     }
 
     try:
-        pdf_response = requests.post(settings.GET_PDF_URL, json=pdf_payload, headers=headers)
+        pdf_response = await get_external_client().post(settings.GET_PDF_URL, json=pdf_payload, headers=_invoice_headers(config))
         pdf_response.raise_for_status()
         pdf_result = pdf_response.json()
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Lỗi khi lấy file PDF: {str(e)}")
 
     file_to_bytes = pdf_result.get("fileToBytes")
-    filename = pdf_result.get("fileName")
     if not file_to_bytes:
         raise HTTPException(status_code=500, detail="Không lấy được file PDF")
 
-    # Step 5: Update order in system
-    upload_attachment_to_teable(data.field_attachment_id, data.record_order_id, data.order_table_id, file_to_bytes, filename)
+    # Keep a local copy so later downloads skip the Viettel round trip
+    file_name = pdf_result.get("fileName")
+    stored = await pdf_store.put(pdf_key(supplier_tax_code, invoice_no, config["template_code"]), file_to_bytes, file_name)
+    return {"file_to_bytes": file_to_bytes, "file_name": file_name, "stored": stored}
+
+async def attach_invoice_to_order(data: InvoiceRequest, file_to_bytes: str, file_name: str) -> None:
+    """Upload the invoice PDF to the order record"""
+    try:
+        await upload_attachment_to_teable(data.field_attachment_id, data.record_order_id, data.order_table_id, file_to_bytes, file_name)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Tạo hóa đơn thành công nhưng tải file lên order thất bại: {str(e)}")
+
+async def mark_order_invoiced(data: InvoiceRequest, invoice_no: str) -> None:
+    """Set the invoice code and state on the order record"""
     update_fields = {
         "invoice_code": invoice_no,
         "invoice_state": True
     }
 
-    if not update_user_table_id(data.order_table_id, data.record_order_id, update_fields):
+    if not await update_user_table_id(data.order_table_id, data.record_order_id, update_fields):
         raise HTTPException(
             status_code=500,
             detail="Tạo hóa đơn thành công nhưng cập nhật order thất bại."
         )
 
+async def generate_invoice_service(data: InvoiceRequest) -> dict:
+    """Handle invoice generation"""
+    # Step 1: Get user configuration including invoice_token and invoice config
+    config = await get_invoice_config(data.username)
+
+    # Step 2 & 3: Prepare payload with configuration values and create invoice
+    created = await create_invoice(config, data.invoice_payload)
+    invoice_no = created["invoice_no"]
+
+    # Step 4: Get PDF
+    pdf = await fetch_invoice_pdf(config, created["supplier_tax_code"], invoice_no)
+
+    # Step 5: Update order in system
+    await attach_invoice_to_order(data, pdf.pop("file_to_bytes"), pdf["file_name"])
+    await mark_order_invoiced(data, invoice_no)
+
     return {
         "detail": "Hóa đơn đã tạo và cập nhật vào order thành công.",
         "invoice_no": invoice_no,
-        "file_name": pdf_result.get("fileName")
+        "file_name": pdf["file_name"]
+    }
+
+async def get_invoice_pdf_service(invoice_no: str, username: str, supplier_tax_code: str, template_code: Optional[str] = None,
+                                  range_header: Optional[str] = None, if_none_match: Optional[str] = None) -> Response:
+    """Serve an invoice PDF from the local store, falling back to Viettel on a miss"""
+    config = None
+    if not template_code:
+        config = await get_invoice_config(username)
+        template_code = config["template_code"]
+
+    entry = await pdf_store.get(pdf_key(supplier_tax_code, invoice_no, template_code))
+    if entry is None:
+        config = config or await get_invoice_config(username)
+        pdf = await fetch_invoice_pdf({**config, "template_code": template_code}, supplier_tax_code, invoice_no)
+        entry = pdf["stored"]
+        if entry is None:
+            return Response(content=base64.b64decode(pdf["file_to_bytes"]), media_type="application/pdf")
+
+    return file_response(entry["path"], entry["size"], entry["digest"], "application/pdf", entry["file_name"], range_header, if_none_match)
+
+async def generate_invoices_batch_service(data: BatchInvoiceRequest) -> dict:
+    """Handle invoice generation for many orders of one tenant"""
+    # Step 1: Get user configuration once for the whole batch
+    config = await get_invoice_config(data.username)
+    semaphore = asyncio.Semaphore(settings.INVOICE_BATCH_CONCURRENCY)
+
+    async def run(item: BatchInvoiceItem) -> dict:
+        row = {"record_order_id": item.record_order_id, "status": "error", "invoice_no": None, "file_name": None, "error": None}
+        request = InvoiceRequest(
+            username=data.username,
+            order_table_id=data.order_table_id,
+            record_order_id=item.record_order_id,
+            field_attachment_id=data.field_attachment_id,
+            invoice_payload=item.invoice_payload
+        )
+        async with semaphore:
+            try:
+                # Step 2-4: Create invoice, get PDF and upload it to the order
+                created = await create_invoice(config, item.invoice_payload)
+                row["invoice_no"] = created["invoice_no"]
+                pdf = await fetch_invoice_pdf(config, created["supplier_tax_code"], created["invoice_no"])
+                row["file_name"] = pdf["file_name"]
+                await attach_invoice_to_order(request, pdf.pop("file_to_bytes"), pdf["file_name"])
+                row["status"] = "success"
+            except Exception as e:
+                # One bad row must not abort the batch: invoices already created for other rows still get recorded
+                row["error"] = str(e.detail) if isinstance(e, HTTPException) else f"Lỗi không mong muốn: {str(e)}"
+                if row["invoice_no"]:
+                    # Created at Viettel but the PDF is not on the order yet; retrying must not issue it again
+                    row["status"] = "attachment_pending"
+        return row
+
+    results = await asyncio.gather(*(run(item) for item in data.invoices))
+
+    # Step 5: Record every created invoice on its order with bulk PATCH requests; only orders that also
+    # got their PDF are marked as invoiced, the others keep the code with invoice_state unset
+    updates = [
+        (r["record_order_id"], {"invoice_code": r["invoice_no"], "invoice_state": r["status"] == "success"})
+        for r in results if r["invoice_no"]
+    ]
+    update_result = await update_records(data.order_table_id, updates) if updates else {"failed": {}}
+    for row in results:
+        if row["record_order_id"] in update_result["failed"]:
+            row["status"] = "error"
+            row["error"] = f"Đã tạo hóa đơn {row['invoice_no']} nhưng cập nhật order thất bại."
+
+    succeeded = sum(1 for r in results if r["status"] == "success")
+    return {
+        "detail": "Đã xử lý yêu cầu tạo hóa đơn hàng loạt.",
+        "total": len(results),
+        "succeeded": succeeded,
+        "failed": len(results) - succeeded,
+        "results": results
     }
@@ -0,0 +1,71 @@
+import asyncio
+import logging
+from datetime import datetime
+from typing import Any, Dict, Optional
+from app.core.config import settings
+from app.services.teable_service import update_records
+
+logger = logging.getLogger(__name__)
+
+class LastLoginBuffer:
+    """Write-behind buffer for last_login: one pending timestamp per user, flushed as a bulk PATCH"""
+
+    def __init__(self, table_id: str, flush_interval: float):
+        self.table_id = table_id
+        self.flush_interval = flush_interval
+        self.recorded = 0
+        self.written = 0
+        self.failed = 0
+        self._pending: Dict[str, str] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def record(self, record_id: str, at: Optional[datetime] = None) -> None:
+        """Note a signin; later signins by the same user overwrite the pending timestamp"""
+        self._pending[record_id] = (at or datetime.now()).isoformat()
+        self.recorded += 1
+
+    async def flush(self) -> int:
+        """Write all pending timestamps, returning how many records were sent"""
+        if not self._pending:
+            return 0
+        batch, self._pending = self._pending, {}
+        result = await update_records(self.table_id, [(record_id, {"last_login": at}) for record_id, at in batch.items()])
+        failed = result["failed"]
+        self.written += len(batch) - len(failed)
+        self.failed += len(failed)
+        for record_id in failed:
+            # Keep the failed timestamp for the next flush unless the user signed in again meanwhile
+            self._pending.setdefault(record_id, batch[record_id])
+        return len(batch)
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Không thể cập nhật last_login: {str(e)}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {"pending": len(self._pending), "recorded": self.recorded, "written": self.written, "failed": self.failed}
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.error(f"Không thể cập nhật last_login khi tắt máy chủ: {str(e)}")
+
+last_login_buffer = LastLoginBuffer(settings.TEABLE_TABLE_ID, flush_interval=settings.LAST_LOGIN_FLUSH_INTERVAL)
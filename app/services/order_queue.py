@@ -0,0 +1,179 @@
+import json
+import time
+import uuid
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional
+from app.core.config import settings
+from app.schemas.orders import CreateOrderRequest, BulkCreateOrderRequest
+from app.services.order_service import create_orders_bulk_service
+from app.utils.sqlite_store import SQLiteStore
+
+logger = logging.getLogger(__name__)
+
+ORDER_QUEUE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS order_queue (
+    id TEXT PRIMARY KEY,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL DEFAULT 0,
+    order_id TEXT,
+    result TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_order_queue_pending ON order_queue (status, next_attempt_at);
+"""
+
+class OrderQueue:
+    """Durable local write-ahead queue for orders, drained to Teable in the background"""
+
+    def __init__(self, path: str, batch_size: int = 200, flush_interval: float = 1.0, max_attempts: int = 10):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_attempts = max_attempts
+        self._store = SQLiteStore(path, ORDER_QUEUE_SCHEMA)
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def _enqueue(self, data: CreateOrderRequest) -> str:
+        local_id = uuid.uuid4().hex
+        now = time.time()
+        self._store.execute(
+            "INSERT INTO order_queue (id, payload, created_at, updated_at) VALUES (?, ?, ?, ?)",
+            (local_id, data.model_dump_json(), now, now)
+        )
+        return local_id
+
+    async def enqueue(self, data: CreateOrderRequest) -> str:
+        """Persist an order locally and return its local order ID"""
+        local_id = await asyncio.to_thread(self._enqueue, data)
+        self._wakeup.set()
+        return local_id
+
+    def _get(self, local_id: str) -> Optional[Dict[str, Any]]:
+        rows = self._store.execute(
+            "SELECT id, status, attempts, order_id, result, error, created_at, updated_at, payload FROM order_queue WHERE id = ?",
+            (local_id,)
+        )
+        if not rows:
+            return None
+        row = rows[0]
+        return {
+            "local_order_id": row[0],
+            "username": json.loads(row[8]).get("username"),
+            "status": row[1],
+            "attempts": row[2],
+            "order_id": row[3],
+            "result": json.loads(row[4]) if row[4] else None,
+            "error": row[5],
+            "created_at": row[6],
+            "updated_at": row[7]
+        }
+
+    async def get(self, local_id: str) -> Optional[Dict[str, Any]]:
+        """Resolve a local order ID to its flush status and Teable record ID"""
+        return await asyncio.to_thread(self._get, local_id)
+
+    def _pending_count(self) -> int:
+        return self._store.execute("SELECT COUNT(*) FROM order_queue WHERE status = 'pending'")[0][0]
+
+    def _reconciliation_count(self) -> int:
+        return self._store.execute("SELECT COUNT(*) FROM order_queue WHERE status = 'needs_reconciliation'")[0][0]
+
+    def stats(self) -> Dict[str, Any]:
+        if self._task is None:
+            return {"enabled": False}
+        return {"enabled": True, "pending": self._pending_count(), "needs_reconciliation": self._reconciliation_count()}
+
+    def _claim_batch(self) -> List[tuple]:
+        return self._store.execute(
+            "SELECT id, payload, attempts FROM order_queue WHERE status = 'pending' AND next_attempt_at <= ? "
+            "ORDER BY created_at LIMIT ?",
+            (time.time(), self.batch_size)
+        )
+
+    def _record_results(self, rows: List[tuple], results: List[dict]) -> None:
+        now = time.time()
+        with self._store.transaction() as conn:
+            for (local_id, _, attempts), result in zip(rows, results):
+                if result["status"] == "success":
+                    conn.execute(
+                        "UPDATE order_queue SET status = 'done', order_id = ?, result = ?, error = NULL, updated_at = ? WHERE id = ?",
+                        (result["order_id"], json.dumps(result), now, local_id)
+                    )
+                elif result["status"] == "unconfirmed":
+                    # The order POST failed in transit and may have been applied; retrying could duplicate the
+                    # order, so the row waits for reconciliation with its detail IDs kept in the result
+                    conn.execute(
+                        "UPDATE order_queue SET status = 'needs_reconciliation', result = ?, error = ?, updated_at = ? WHERE id = ?",
+                        (json.dumps(result), result.get("error"), now, local_id)
+                    )
+                else:
+                    attempts += 1
+                    final = attempts >= self.max_attempts
+                    conn.execute(
+                        "UPDATE order_queue SET status = ?, attempts = ?, next_attempt_at = ?, error = ?, updated_at = ? WHERE id = ?",
+                        ("failed" if final else "pending", attempts, now + min(2 ** attempts, 300), result.get("error"), now, local_id)
+                    )
+
+    async def flush(self) -> int:
+        """Send one coalesced batch of pending orders to Teable, returning how many were attempted"""
+        rows = await asyncio.to_thread(self._claim_batch)
+        if not rows:
+            return 0
+        orders = [CreateOrderRequest.model_validate_json(payload) for _, payload, _ in rows]
+        try:
+            response = await create_orders_bulk_service(BulkCreateOrderRequest(orders=orders))
+            results = response["results"]
+        except Exception as e:
+            error = getattr(e, "detail", str(e))
+            results = [{"status": "error", "error": error} for _ in rows]
+        await asyncio.to_thread(self._record_results, rows, results)
+        logger.info(f"Flushed {len(rows)} queued orders ({sum(r['status'] == 'success' for r in results)} succeeded)")
+        unconfirmed = sum(r["status"] == "unconfirmed" for r in results)
+        if unconfirmed:
+            logger.warning(f"{unconfirmed} queued orders need reconciliation: their creation could not be confirmed")
+        return len(rows)
+
+    async def _flush_loop(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+                # Give concurrent requests a moment to land so they share one batch
+                await asyncio.sleep(min(0.2, self.flush_interval))
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                while await self.flush() == self.batch_size:
+                    pass
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Lỗi khi đẩy đơn hàng trong hàng đợi lên Teable: {str(e)}")
+
+    def start(self) -> None:
+        if self._task is None:
+            self._store.open()
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._store.close()
+
+order_queue = OrderQueue(
+    settings.ORDER_QUEUE_PATH,
+    batch_size=settings.ORDER_QUEUE_BATCH_SIZE,
+    flush_interval=settings.ORDER_QUEUE_FLUSH_INTERVAL,
+    max_attempts=settings.ORDER_QUEUE_MAX_ATTEMPTS
+)
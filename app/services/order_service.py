@@ -1,8 +1,25 @@
+import io
+import csv
 import json
-import requests
+import httpx
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Dict, List, Tuple
 from fastapi import HTTPException, status
+from fastapi.responses import StreamingResponse
 from app.core.config import settings
-from app.schemas.orders import CreateOrderRequest
+from app.core.http_client import get_teable_client
+from app.services.teable_service import create_records, delete_records, iter_record_pages, get_records_by_ids
+from app.services.pricing_engine import pricing_engine
+from app.schemas.orders import CreateOrderRequest, BulkCreateOrderRequest, ExportOrdersQuery
+
+logger = logging.getLogger(__name__)
+
+# CSV export columns: one row per order line, order columns repeated on each line
+ORDER_EXPORT_FIELDS = ["order_number", "customer_name", "invoice_state", "invoice_code", "total_temp", "total_vat", "total_after_vat"]
+DETAIL_EXPORT_FIELDS = ["product_name", "unit_price", "quantity", "vat", "temp_total", "final_total"]
+# Order fields left out of exports: links are replaced by the detail records, attachments are not exported
+_SKIPPED_ORDER_FIELDS = ("invoice_details", "invoice_file")
 
 async def create_order_service(data: CreateOrderRequest) -> dict:
     """Handle order creation"""
@@ -13,19 +30,19 @@ async def create_order_service(data: CreateOrderRequest) -> dict:
             "Accept": "application/json"
         }
 
-        # Calculate totals
-        total_temp = sum(item.unit_price * item.quantity for item in data.order_details)
-        total_vat = sum(item.unit_price * item.quantity * item.vat / 100 for item in data.order_details)
-        total_after_vat = total_temp + total_vat
+        # Price lines and totals server-side
+        priced = (await pricing_engine.price_orders([data]))[0]
+        total_temp, total_vat, total_after_vat = priced["total_temp"], priced["total_vat"], priced["total_after_vat"]
 
         # Create order details
         detail_payload = {
             "fieldKeyType": "dbFieldName",
             "typecast": True,
-            "records": [{"fields": d.model_dump()} for d in data.order_details]
+            "records": [{"fields": line} for line in priced["lines"]]
         }
         detail_url = f"{settings.TEABLE_BASE_URL}/table/{data.detail_table_id}/record"
-        response_detail = requests.post(detail_url, data=json.dumps(detail_payload), headers=headers)
+        client = get_teable_client()
+        response_detail = await client.post(detail_url, json=detail_payload, headers=headers)
         if response_detail.status_code != 201:
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Không thể tạo chi tiết đơn hàng: {response_detail.text}")
 
@@ -47,8 +64,9 @@ async def create_order_service(data: CreateOrderRequest) -> dict:
             }]
         }
         order_url = f"{settings.TEABLE_BASE_URL}/table/{data.order_table_id}/record"
-        response_order = requests.post(order_url, data=json.dumps(order_payload), headers=headers)
+        response_order = await client.post(order_url, json=order_payload, headers=headers)
         if response_order.status_code != 201:
+            await delete_records(data.detail_table_id, detail_ids)
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Không thể tạo đơn hàng: {response_order.text}")
 
         return {
@@ -62,3 +80,185 @@ async def create_order_service(data: CreateOrderRequest) -> dict:
         raise
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Lỗi không mong muốn khi tạo đơn hàng: {str(e)}")
+
+
+def _chunk_orders(indexed_orders: List[Tuple[int, dict]], batch_size: int) -> List[List[Tuple[int, dict]]]:
+    """Group orders so each chunk carries at most `batch_size` detail records (and orders)"""
+    chunks, current, current_details = [], [], 0
+    for index, order in indexed_orders:
+        if current and (current_details + len(order["lines"]) > batch_size or len(current) >= batch_size):
+            chunks.append(current)
+            current, current_details = [], 0
+        current.append((index, order))
+        current_details += len(order["lines"])
+    if current:
+        chunks.append(current)
+    return chunks
+
+async def _create_order_chunk(chunk: List[Tuple[int, dict]], results: List[dict], semaphore: asyncio.Semaphore) -> None:
+    """Create the details of a chunk of priced orders in one POST, then the orders in one POST"""
+    def fail(error: str) -> None:
+        for index, _ in chunk:
+            results[index] = {"index": index, "status": "error", "error": error}
+
+    async with semaphore:
+        detail_table_id, order_table_id = chunk[0][1]["request"].detail_table_id, chunk[0][1]["request"].order_table_id
+        detail_result = await create_records(detail_table_id, [line for _, order in chunk for line in order["lines"]])
+        if not detail_result["success"]:
+            fail(f"Không thể tạo chi tiết đơn hàng: {detail_result['error']}")
+            return
+
+        detail_ids = [r["id"] for r in detail_result["records"]]
+        orders_fields, offset = [], 0
+        for index, order in chunk:
+            total_temp, total_vat, total_after_vat = order["total_temp"], order["total_vat"], order["total_after_vat"]
+            order_detail_ids = detail_ids[offset:offset + len(order["lines"])]
+            offset += len(order["lines"])
+            results[index] = {
+                "index": index,
+                "detail_ids": order_detail_ids,
+                "total_temp": total_temp,
+                "total_vat": total_vat,
+                "total_after_vat": total_after_vat
+            }
+            orders_fields.append({
+                "customer_name": order["request"].customer_name,
+                "invoice_details": order_detail_ids,
+                "total_temp": total_temp,
+                "total_vat": total_vat,
+                "total_after_vat": total_after_vat
+            })
+
+        order_result = await create_records(order_table_id, orders_fields)
+        if not order_result["success"]:
+            # Drop the lines just created so a retry does not leave another orphaned set behind; after a
+            # network error the orders may exist after all, so their lines are kept
+            if order_result.get("status_code"):
+                await delete_records(detail_table_id, detail_ids)
+                fail(f"Không thể tạo đơn hàng: {order_result['error']}")
+            else:
+                for index, _ in chunk:
+                    # Whether Teable created these orders is unknown, so they must not be created again blindly
+                    results[index].update({"status": "unconfirmed", "error": f"Không xác nhận được việc tạo đơn hàng: {order_result['error']}"})
+            return
+
+        order_ids = [r["id"] for r in order_result["records"]]
+        orphaned = []
+        for position, (index, _) in enumerate(chunk):
+            if position < len(order_ids):
+                results[index].update({"status": "success", "order_id": order_ids[position]})
+            else:
+                orphaned.extend(results[index]["detail_ids"])
+                results[index].update({"status": "error", "error": "Không nhận được bản ghi đơn hàng từ Teable"})
+        if orphaned:
+            await delete_records(detail_table_id, orphaned)
+
+async def create_orders_bulk_service(data: BulkCreateOrderRequest) -> dict:
+    """Handle bulk order import with chunked batch record creation"""
+    try:
+        # All lines of all orders are priced in one pass before batching
+        priced = await pricing_engine.price_orders(data.orders)
+
+        # Orders can only share a batch request when they target the same tables
+        groups = {}
+        for index, order in enumerate(data.orders):
+            groups.setdefault((order.detail_table_id, order.order_table_id), []).append((index, {**priced[index], "request": order}))
+
+        chunks = [chunk for group in groups.values() for chunk in _chunk_orders(group, settings.TEABLE_BATCH_SIZE)]
+        results: List[dict] = [None] * len(data.orders)
+        semaphore = asyncio.Semaphore(settings.TEABLE_BATCH_CONCURRENCY)
+        await asyncio.gather(*(_create_order_chunk(chunk, results, semaphore) for chunk in chunks))
+
+        succeeded = sum(1 for r in results if r["status"] == "success")
+        return {
+            "status": "success" if succeeded == len(results) else ("partial" if succeeded else "error"),
+            "total": len(results),
+            "succeeded": succeeded,
+            "failed": len(results) - succeeded,
+            "results": results
+        }
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Lỗi không mong muốn khi nhập đơn hàng: {str(e)}")
+
+
+def _linked_ids(order: Dict[str, Any]) -> List[str]:
+    links = order.get("fields", {}).get("invoice_details") or []
+    return [link["id"] for link in (links if isinstance(links, list) else [links]) if isinstance(link, dict) and link.get("id")]
+
+async def _iter_orders_with_details(pages: AsyncIterator[List[dict]], detail_table_id: str) -> AsyncIterator[List[dict]]:
+    """Attach the linked detail records to each page of orders, one page at a time"""
+    async for orders in pages:
+        details = await get_records_by_ids(detail_table_id, [detail_id for order in orders for detail_id in _linked_ids(order)])
+        yield [
+            {
+                "id": order["id"],
+                **{key: value for key, value in order.get("fields", {}).items() if key not in _SKIPPED_ORDER_FIELDS},
+                "details": [{"id": detail_id, **details[detail_id].get("fields", {})} for detail_id in _linked_ids(order) if detail_id in details]
+            }
+            for order in orders
+        ]
+
+def _ndjson_page(orders: List[dict]) -> str:
+    return "".join(json.dumps(order, ensure_ascii=False, default=str) + "\n" for order in orders)
+
+def _ndjson_error(message: str) -> str:
+    return json.dumps({"error": message}, ensure_ascii=False) + "\n"
+
+def _csv_header() -> str:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow(["order_id"] + ORDER_EXPORT_FIELDS + DETAIL_EXPORT_FIELDS)
+    return buffer.getvalue()
+
+def _csv_page(orders: List[dict]) -> str:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for order in orders:
+        order_row = [order["id"]] + [order.get(field, "") for field in ORDER_EXPORT_FIELDS]
+        # Orders without lines still get one row
+        for detail in order["details"] or [{}]:
+            writer.writerow(order_row + [detail.get(field, "") for field in DETAIL_EXPORT_FIELDS])
+    return buffer.getvalue()
+
+def _csv_error(message: str) -> str:
+    # Trailing marker row so a truncated export cannot pass for a complete one
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow(["#ERROR", message])
+    return buffer.getvalue()
+
+async def export_orders_service(query: ExportOrdersQuery, export_format: str = "ndjson") -> StreamingResponse:
+    """Stream every order of a tenant with its lines as NDJSON or CSV, holding one page in memory at a time"""
+    if export_format not in ("ndjson", "csv"):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Định dạng xuất không hợp lệ, chỉ hỗ trợ ndjson hoặc csv")
+
+    pages = _iter_orders_with_details(iter_record_pages(query.order_table_id, settings.EXPORT_PAGE_SIZE), query.detail_table_id)
+    # Fetch the first page up front so a bad table ID is reported with a proper status code
+    try:
+        first_page = await pages.__anext__()
+    except StopAsyncIteration:
+        first_page = []
+    except httpx.HTTPStatusError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Không thể đọc đơn hàng: {str(e)}")
+    except httpx.HTTPError as e:
+        raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY, detail=f"Lỗi mạng khi đọc đơn hàng: {str(e)}")
+
+    render = _csv_page if export_format == "csv" else _ndjson_page
+    render_error = _csv_error if export_format == "csv" else _ndjson_error
+
+    async def body() -> AsyncIterator[str]:
+        if export_format == "csv":
+            # BOM so spreadsheet apps read the Vietnamese text as UTF-8
+            yield "\ufeff" + _csv_header()
+        try:
+            yield render(first_page)
+            async for orders in pages:
+                yield render(orders)
+        except httpx.HTTPError as e:
+            # Headers are already sent, so the failure can only be reported in the body
+            logger.error(f"Xuất đơn hàng bị gián đoạn: {str(e)}")
+            yield render_error(f"Xuất đơn hàng bị gián đoạn: {str(e)}")
+        finally:
+            await pages.aclose()
+
+    media_type = "text/csv; charset=utf-8" if export_format == "csv" else "application/x-ndjson"
+    headers = {"Content-Disposition": f'attachment; filename="orders.{export_format}"'}
+    return StreamingResponse(body(), media_type=media_type, headers=headers)
@@ -0,0 +1,123 @@
+import os
+import time
+import uuid
+import base64
+import hashlib
+import asyncio
+import logging
+from typing import Any, Dict, Optional
+from app.core.config import settings
+from app.utils.sqlite_store import SQLiteStore
+
+logger = logging.getLogger(__name__)
+
+PDF_INDEX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS pdf_index (
+    key TEXT PRIMARY KEY,
+    digest TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    file_name TEXT,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_pdf_index_digest ON pdf_index (digest);
+CREATE INDEX IF NOT EXISTS idx_pdf_index_last_access ON pdf_index (last_access);
+"""
+
+# Base64 characters decoded per chunk when writing a PDF to the store
+_DECODE_STEP = 64 * 1024 // 3 * 4
+
+def pdf_key(supplier_tax_code: str, invoice_no: str, template_code: str) -> str:
+    return f"{supplier_tax_code}:{template_code}:{invoice_no}"
+
+class PdfStore:
+    """Content-addressed local store of invoice PDFs with size-bounded LRU eviction"""
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._index = SQLiteStore(os.path.join(directory, "index.db"), PDF_INDEX_SCHEMA)
+
+    def blob_path(self, digest: str) -> str:
+        return os.path.join(self.directory, digest[:2], f"{digest}.pdf")
+
+    def _put(self, key: str, file_to_bytes: str, file_name: Optional[str]) -> Dict[str, Any]:
+        if "\n" in file_to_bytes or "\r" in file_to_bytes:
+            file_to_bytes = "".join(file_to_bytes.split())
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = os.path.join(self.directory, f".{uuid.uuid4().hex}.tmp")
+        digest, size = hashlib.sha256(), 0
+        try:
+            with open(tmp_path, "wb") as f:
+                for offset in range(0, len(file_to_bytes), _DECODE_STEP):
+                    chunk = base64.b64decode(file_to_bytes[offset:offset + _DECODE_STEP])
+                    digest.update(chunk)
+                    size += len(chunk)
+                    f.write(chunk)
+            hexdigest = digest.hexdigest()
+            path = self.blob_path(hexdigest)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        self._index.execute(
+            "INSERT OR REPLACE INTO pdf_index (key, digest, size, file_name, last_access) VALUES (?, ?, ?, ?, ?)",
+            (key, hexdigest, size, file_name, time.time())
+        )
+        self._evict()
+        return {"digest": hexdigest, "size": size, "file_name": file_name, "path": path}
+
+    def _evict(self) -> None:
+        total = self._index.execute("SELECT COALESCE(SUM(size), 0) FROM (SELECT digest, MAX(size) AS size FROM pdf_index GROUP BY digest)")[0][0]
+        if total <= self.max_bytes:
+            return
+        for key, digest, size in self._index.execute("SELECT key, digest, size FROM pdf_index ORDER BY last_access"):
+            if total <= self.max_bytes:
+                break
+            self._index.execute("DELETE FROM pdf_index WHERE key = ?", (key,))
+            if not self._index.execute("SELECT 1 FROM pdf_index WHERE digest = ? LIMIT 1", (digest,)):
+                try:
+                    os.remove(self.blob_path(digest))
+                except FileNotFoundError:
+                    pass
+                total -= size
+
+    def _get(self, key: str) -> Optional[Dict[str, Any]]:
+        rows = self._index.execute("SELECT digest, size, file_name FROM pdf_index WHERE key = ?", (key,))
+        if not rows:
+            return None
+        digest, size, file_name = rows[0]
+        path = self.blob_path(digest)
+        if not os.path.exists(path):
+            self._index.execute("DELETE FROM pdf_index WHERE key = ?", (key,))
+            return None
+        self._index.execute("UPDATE pdf_index SET last_access = ? WHERE key = ?", (time.time(), key))
+        return {"digest": digest, "size": size, "file_name": file_name, "path": path}
+
+    async def put(self, key: str, file_to_bytes: str, file_name: Optional[str]) -> Optional[Dict[str, Any]]:
+        """Decode a base64 PDF into the store; failures are logged, never raised"""
+        try:
+            return await asyncio.to_thread(self._put, key, file_to_bytes, file_name)
+        except Exception as e:
+            logger.error(f"Không thể lưu file PDF {key} vào bộ nhớ đệm: {str(e)}")
+            return None
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return {"digest", "size", "file_name", "path"} for a stored PDF"""
+        entry = await asyncio.to_thread(self._get, key)
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry
+
+    def stats(self) -> Dict[str, Any]:
+        return {"hits": self.hits, "misses": self.misses, "max_bytes": self.max_bytes}
+
+    def close(self) -> None:
+        self._index.close()
+
+pdf_store = PdfStore(settings.PDF_STORE_DIR, settings.PDF_STORE_MAX_BYTES)
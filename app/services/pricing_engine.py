@@ -0,0 +1,137 @@
+import logging
+from collections import OrderedDict
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+from app.core.config import settings
+from app.services.catalog_index import TenantCatalog, catalog_index
+from app.schemas.orders import CreateOrderRequest
+from app.utils.trigram import fold
+
+logger = logging.getLogger(__name__)
+
+# VAT rates are held in basis points so VAT amounts stay in exact integer arithmetic
+_BP = 10000
+
+def to_dong(value: Any) -> int:
+    """Round a money amount to whole đồng, half up"""
+    return int(Decimal(str(value)).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+def to_basis_points(percent: Any) -> int:
+    return int((Decimal(str(percent or 0)) * 100).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+class PriceTable:
+    """A tenant's unit conversions flattened into arrays: resolved unit price (đồng) and VAT (basis points)"""
+
+    def __init__(self, units: Dict[str, Dict[str, Any]], version: int):
+        self.version = version
+        self.index: Dict[str, int] = {}
+        prices, vats = [], []
+        base_prices = {
+            unit["folded"]: unit["price"] for unit in units.values()
+            if unit.get("price") is not None and unit.get("conversion_factor") in (1, 1.0)
+        }
+        for unit_id, unit in units.items():
+            price = unit.get("price")
+            if price is None:
+                # A unit without its own price is priced as factor x its default unit's price
+                base = base_prices.get(fold(str(unit.get("unit_default") or "")))
+                factor = unit.get("conversion_factor")
+                price = Decimal(str(base)) * Decimal(str(factor)) if base is not None and factor else None
+            self.index[unit_id] = len(prices)
+            prices.append(to_dong(price) if price is not None else -1)
+            vats.append(to_basis_points(unit.get("vat")) if unit.get("vat") is not None else -1)
+        self.prices = np.array(prices, dtype=np.int64)
+        self.vats = np.array(vats, dtype=np.int64)
+
+def _round_half_up_div(numerator: np.ndarray, denominator: int) -> np.ndarray:
+    return np.sign(numerator) * ((np.abs(numerator) + denominator // 2) // denominator)
+
+def compute_totals(prices: np.ndarray, quantities: np.ndarray, vats: np.ndarray,
+                   order_index: np.ndarray, order_count: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Line subtotals and VAT for all lines at once, plus per-order sums of both (int64 đồng)"""
+    temp = prices * quantities
+    vat = _round_half_up_div(temp * vats, _BP)
+    order_temp = np.zeros(order_count, dtype=np.int64)
+    order_vat = np.zeros(order_count, dtype=np.int64)
+    np.add.at(order_temp, order_index, temp)
+    np.add.at(order_vat, order_index, vat)
+    return temp, vat, order_temp, order_vat
+
+class PricingEngine:
+    """Prices order lines server-side from each tenant's unit conversions, rebuilt only when they change"""
+
+    def __init__(self, max_tenants: int):
+        self.max_tenants = max_tenants
+        self._tables: "OrderedDict[str, PriceTable]" = OrderedDict()
+
+    def _table(self, username: str, catalog: TenantCatalog) -> PriceTable:
+        table = self._tables.get(username)
+        if table is None or table.version != catalog.units_version:
+            table = PriceTable(catalog.units, catalog.units_version)
+            self._tables[username] = table
+            while len(self._tables) > self.max_tenants:
+                self._tables.popitem(last=False)
+        self._tables.move_to_end(username)
+        return table
+
+    def table_for(self, username: Optional[str]) -> Optional[PriceTable]:
+        """Return the tenant's price table if its catalog is loaded; otherwise start loading it and return None"""
+        if not username:
+            return None
+        catalog = catalog_index.peek(username)
+        if catalog is None:
+            # Never load the catalog on the request path: these lines keep the client's prices until it is ready
+            catalog_index.warm(username)
+            return None
+        return self._table(username, catalog)
+
+    async def price_orders(self, orders: List[CreateOrderRequest]) -> List[Dict[str, Any]]:
+        """Return, per order, the detail fields to write and the order totals, in one vectorized pass"""
+        # Every tenant's table is laid end to end, followed by a -1 sentinel that lines without a unit point at
+        offsets, table_prices, table_vats, size = {}, [], [], 0
+        for username in {order.username for order in orders}:
+            table = self.table_for(username)
+            if table is not None:
+                offsets[username] = (table, size)
+                table_prices.append(table.prices)
+                table_vats.append(table.vats)
+                size += len(table.prices)
+        table_prices = np.concatenate(table_prices + [np.array([-1], dtype=np.int64)])
+        table_vats = np.concatenate(table_vats + [np.array([-1], dtype=np.int64)])
+
+        def row(username: Optional[str], unit_id: Optional[str]) -> int:
+            table, offset = offsets.get(username, (None, 0))
+            local = table.index.get(unit_id) if table is not None and unit_id else None
+            return offset + local if local is not None else -1
+
+        details = [(position, order.username, detail) for position, order in enumerate(orders) for detail in order.order_details]
+        rows = np.array([row(username, detail.unit_id) for _, username, detail in details], dtype=np.int64)
+        client_prices = np.array([to_dong(detail.unit_price) for _, _, detail in details], dtype=np.int64)
+        client_vats = np.array([to_basis_points(detail.vat) for _, _, detail in details], dtype=np.int64)
+
+        # Catalog values win where the unit is known and has them, the client's otherwise
+        catalog_prices, catalog_vats = table_prices[rows], table_vats[rows]
+        prices = np.where(catalog_prices >= 0, catalog_prices, client_prices)
+        vats = np.where(catalog_vats >= 0, catalog_vats, client_vats)
+
+        temp, vat, order_temp, order_vat = compute_totals(
+            prices, np.array([detail.quantity for _, _, detail in details], dtype=np.int64), vats,
+            np.array([position for position, _, _ in details], dtype=np.int64), len(orders)
+        )
+
+        results = [{"lines": [], "total_temp": t, "total_vat": v, "total_after_vat": t + v}
+                   for t, v in zip(order_temp.tolist(), order_vat.tolist())]
+        for (position, _, detail), price, line_vat, line_temp, line_vat_amount in zip(
+                details, prices.tolist(), vats.tolist(), temp.tolist(), vat.tolist()):
+            results[position]["lines"].append({
+                "product_name": detail.product_name,
+                "unit_price": price,
+                "quantity": detail.quantity,
+                "vat": line_vat / 100,
+                "temp_total": line_temp,
+                "final_total": line_temp + line_vat_amount
+            })
+        return results
+
+pricing_engine = PricingEngine(max_tenants=settings.CATALOG_MAX_TENANTS)
@@ -0,0 +1,180 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
+from fastapi import HTTPException, status
+from app.core.config import settings
+from app.core.http_client import get_teable_client
+from app.services.teable_service import handle_teable_api_call, create_table, update_user_table_id
+
+logger = logging.getLogger(__name__)
+
+PROVISIONING_IN_PROGRESS = "in_progress"
+PROVISIONING_COMPLETED = "completed"
+
+# User record fields that hold provisioning progress
+PROGRESS_FIELDS = ("space_id", "base_id", "table_order_detail_id", "table_order_id", "upload_file_id", "table_invoice_info_id")
+
+def detail_table_payload() -> dict:
+    """Payload for the order detail table"""
+    return {"name": "Chi Tiết Hoá Đơn", "description": "Chi tiết đơn hàng", "icon": "🧾", "fields": [
+        {"type": "autoNumber", "name": "Số đơn hàng chi tiết", "dbFieldName": "number_order_detail"},
+        {"type": "longText", "name": "Tên Hàng Hoá", "dbFieldName": "product_name"},
+        {"type": "number", "name": "Đơn Giá", "dbFieldName": "unit_price"},
+        {"type": "number", "name": "Số Lượng", "dbFieldName": "quantity"},
+        {"type": "number", "name": "VAT", "dbFieldName": "vat"},
+        {"type": "number", "name": "Tạm Tính", "dbFieldName": "temp_total"},
+        {"type": "number", "name": "Thành Tiền", "dbFieldName": "final_total"}
+    ], "fieldKeyType": "dbFieldName", "records": []}
+
+def order_table_payload(detail_table_id: str) -> dict:
+    """Payload for the order table, linked to the order detail table"""
+    return {"name": "Đơn Hàng", "description": "Bảng lưu thông tin các đơn hàng", "icon": "📦", "fields": [
+        {"type": "formula", "name": "Số đơn hàng", "dbFieldName": "order_number", "options": {"expression": "concatenate('DH-', DATETIME_FORMAT(CREATED_TIME(), 'DDMMYYYY'), '-', AUTO_NUMBER())"}},
+        {"type": "longText", "name": "Tên Khách Hàng", "dbFieldName": "customer_name"},
+        {"type": "link", "name": "Chi Tiết Hóa Đơn", "dbFieldName": "invoice_details", "options": {"foreignTableId": detail_table_id, "relationship": "oneMany"}},
+        {"type": "checkbox", "name": "Xuất hoá đơn", "dbFieldName": "invoice_state"},
+        {"type": "number", "name": "Tổng Tạm Tính", "dbFieldName": "total_temp"},
+        {"type": "number", "name": "Tổng VAT", "dbFieldName": "total_vat"},
+        {"type": "number", "name": "Tổng Sau VAT", "dbFieldName": "total_after_vat"},
+        {"type": "singleLineText", "name": "Mã hoá đơn", "dbFieldName": "invoice_code"},
+        {"type": "attachment", "name": "File hoá đơn", "dbFieldName": "invoice_file"}
+    ], "fieldKeyType": "dbFieldName", "records": []}
+
+def invoice_info_table_payload() -> dict:
+    """Payload for the invoice info table"""
+    return {
+        "name": "Invoice Table",
+        "dbTableName": "invoice_table",
+        "description": "Bảng lưu thông tin hóa đơn",
+        "icon": "🧾",
+        "fields": [
+            {"type": "singleLineText", "name": "Mã Hóa Đơn", "dbFieldName": "invoice_template", "description": "Trường mẫu chính", "unique": True},
+            {"type": "singleLineText", "name": "Mã Mẫu", "dbFieldName": "template_code", "description": "Mã mẫu chính"},
+            {"type": "multipleSelect", "name": "Sê-ri Hóa Đơn", "dbFieldName": "invoice_series", "description": "Nhiều sê-ri hóa đơn"}
+        ],
+        "fieldKeyType": "dbFieldName",
+        "records": []
+    }
+
+def _headers() -> dict:
+    return {"Authorization": settings.TEABLE_TOKEN, "Accept": "application/json", "Content-Type": "application/json"}
+
+async def create_space(name: str) -> str:
+    """Create a space in Teable and return its ID"""
+    result = await handle_teable_api_call("POST", f"{settings.TEABLE_BASE_URL}/space", json={"name": name}, headers=_headers())
+    if not result["success"]:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Không thể tạo không gian làm việc")
+    return result["data"]["id"]
+
+async def create_base(space_id: str, name: str) -> str:
+    """Create a base inside a space and return its ID"""
+    result = await handle_teable_api_call("POST", f"{settings.TEABLE_BASE_URL}/base", json={"spaceId": space_id, "name": name, "icon": "📊"}, headers=_headers())
+    if not result["success"]:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Không thể tạo cơ sở dữ liệu")
+    return result["data"]["id"]
+
+async def create_order_table(base_id: str, detail_table_id: str) -> Tuple[str, str]:
+    """Create the order table and return its ID and the invoice_file field ID"""
+    order_table_url = f"{settings.TEABLE_BASE_URL}/base/{base_id}/table/"
+    order_table_response = await get_teable_client().post(order_table_url, json=order_table_payload(detail_table_id), headers=_headers())
+    if order_table_response.status_code != 201:
+        logger.error(f"Không thể tạo bảng đơn hàng: {order_table_response.text}")
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Không thể tạo bảng đơn hàng")
+
+    order_table_data = order_table_response.json()
+
+    # Find the invoice_file field ID
+    upload_file_id = None
+    for field in order_table_data.get("fields", []):
+        if field.get("dbFieldName") == "invoice_file":
+            upload_file_id = field.get("id")
+            break
+
+    if not upload_file_id:
+        logger.warning("Could not find invoice_file field ID in order table")
+        upload_file_id = ""
+
+    return order_table_data["id"], upload_file_id
+
+async def _step_space(ctx: dict) -> dict:
+    return {"space_id": await create_space(f"{ctx['business_name']}_workspace")}
+
+async def _step_base(ctx: dict) -> dict:
+    return {"base_id": await create_base(ctx["space_id"], f"{ctx['business_name']}_database")}
+
+async def _step_detail_table(ctx: dict) -> dict:
+    detail_table_id = await create_table(ctx["base_id"], detail_table_payload(), _headers())
+    if not detail_table_id:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Không thể tạo bảng chi tiết đơn hàng")
+    return {"table_order_detail_id": detail_table_id}
+
+async def _step_order_table(ctx: dict) -> dict:
+    order_table_id, upload_file_id = await create_order_table(ctx["base_id"], ctx["table_order_detail_id"])
+    return {"table_order_id": order_table_id, "upload_file_id": upload_file_id}
+
+async def _step_invoice_info_table(ctx: dict) -> dict:
+    invoice_info_table_id = await create_table(ctx["base_id"], invoice_info_table_payload(), _headers())
+    if not invoice_info_table_id:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Không thể tạo bảng mẫu hóa đơn")
+    return {"table_invoice_info_id": invoice_info_table_id}
+
+# Provisioning graph: step name -> (dependencies, step function, context key that marks it done)
+PROVISIONING_STEPS: Dict[str, Tuple[List[str], Callable[[dict], Awaitable[dict]], str]] = {
+    "space": ([], _step_space, "space_id"),
+    "base": (["space"], _step_base, "base_id"),
+    "detail_table": (["base"], _step_detail_table, "table_order_detail_id"),
+    "order_table": (["detail_table"], _step_order_table, "table_order_id"),
+    "invoice_info_table": (["base"], _step_invoice_info_table, "table_invoice_info_id"),
+}
+
+async def run_step_graph(steps: Dict[str, Tuple[List[str], Callable[[dict], Awaitable[dict]], str]], ctx: Dict[str, Any],
+                         on_step_done: Callable[[str, dict], Awaitable[None]]) -> Dict[str, Any]:
+    """Run steps as soon as their dependencies finish, skipping steps already recorded in `ctx`"""
+    done = {name for name, (_, _, done_key) in steps.items() if ctx.get(done_key)}
+    running: Dict[asyncio.Task, str] = {}
+
+    async def run(name: str) -> dict:
+        outputs = await steps[name][1](ctx)
+        ctx.update(outputs)
+        await on_step_done(name, outputs)
+        return outputs
+
+    try:
+        while len(done) < len(steps):
+            for name, (deps, _, _) in steps.items():
+                if name not in done and name not in running.values() and all(d in done for d in deps):
+                    running[asyncio.create_task(run(name))] = name
+            if not running:
+                raise RuntimeError("Provisioning graph has unsatisfiable dependencies")
+            finished, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for task in finished:
+                name = running.pop(task)
+                task.result()
+                done.add(name)
+    except asyncio.CancelledError:
+        for task in running:
+            task.cancel()
+        await asyncio.gather(*running, return_exceptions=True)
+        raise
+    except Exception:
+        # Steps still in flight may already have created their resources, so let them finish and
+        # record their outputs; a resumed signup would otherwise create them a second time
+        await asyncio.gather(*running, return_exceptions=True)
+        raise
+    return ctx
+
+def is_provisioned(fields: dict) -> bool:
+    """Whether a user record already owns a fully provisioned workspace"""
+    state = fields.get("provisioning_state")
+    if state:
+        return state == PROVISIONING_COMPLETED
+    # Accounts created before progress tracking only get table IDs once everything is done
+    return bool(fields.get("table_order_id"))
+
+async def provision_workspace(record_id: str, ctx: Dict[str, Any]) -> Dict[str, Any]:
+    """Create (or resume creating) the tenant workspace and record progress on the user record"""
+    async def record_progress(step: str, outputs: dict) -> None:
+        if not await update_user_table_id(settings.TEABLE_TABLE_ID, record_id, outputs):
+            logger.warning(f"Failed to record provisioning step '{step}' for record {record_id}")
+
+    return await run_step_graph(PROVISIONING_STEPS, ctx, record_progress)
@@ -0,0 +1,144 @@
+import re
+import time
+import asyncio
+import logging
+import httpx
+from typing import Any, Dict, Optional
+from fastapi import HTTPException, status
+from app.core.config import settings
+from app.core.http_client import get_external_client
+from app.utils.cache import TTLCache
+from app.utils.sqlite_store import SQLiteStore
+
+logger = logging.getLogger(__name__)
+
+TAXCODE_CACHE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS taxcode_cache (
+    taxcode TEXT PRIMARY KEY,
+    business_name TEXT,
+    expires_at REAL NOT NULL
+);
+"""
+
+# 10-digit enterprise codes, optionally followed by a 3-digit branch suffix
+TAXCODE_PATTERN = re.compile(r"^\d{10}(-?\d{3})?$")
+
+# Marks a taxcode VietQR reported as nonexistent
+_INVALID = ""
+
+def _invalid_taxcode() -> HTTPException:
+    return HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Mã số thuế không tồn tại hoặc không hợp lệ")
+
+class TaxcodeLookup:
+    """VietQR business-name lookups with a persistent cache, negative caching and single-flight"""
+
+    def __init__(self, url: str, timeout: float, ttl: float, negative_ttl: float, maxsize: int, path: Optional[str] = None):
+        self.url = url
+        self.timeout = timeout
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.fetched = 0
+        self.coalesced = 0
+        self.disk_hits = 0
+        self._memory = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._store = SQLiteStore(path, TAXCODE_CACHE_SCHEMA) if path else None
+        self._inflight: Dict[str, asyncio.Task] = {}
+
+    def _disk_get(self, taxcode: str) -> Optional[tuple]:
+        rows = self._store.execute("SELECT business_name, expires_at FROM taxcode_cache WHERE taxcode = ? AND expires_at > ?", (taxcode, time.time()))
+        return rows[0] if rows else None
+
+    def _disk_set(self, taxcode: str, business_name: str, ttl: float) -> None:
+        now = time.time()
+        with self._store.transaction() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO taxcode_cache (taxcode, business_name, expires_at) VALUES (?, ?, ?)",
+                (taxcode, business_name or None, now + ttl)
+            )
+            conn.execute("DELETE FROM taxcode_cache WHERE expires_at <= ?", (now,))
+
+    async def _cached(self, taxcode: str) -> Optional[str]:
+        business_name = self._memory.get(taxcode)
+        if business_name is None and self._store is not None:
+            try:
+                row = await asyncio.to_thread(self._disk_get, taxcode)
+            except Exception as e:
+                logger.error(f"Không thể đọc bộ nhớ đệm mã số thuế: {str(e)}")
+                row = None
+            if row is not None:
+                self.disk_hits += 1
+                business_name = row[0] or _INVALID
+                self._memory.set(taxcode, business_name, ttl=row[1] - time.time())
+        return business_name
+
+    async def _remember(self, taxcode: str, business_name: str) -> None:
+        ttl = self.ttl if business_name else self.negative_ttl
+        self._memory.set(taxcode, business_name, ttl=ttl)
+        if self._store is not None:
+            try:
+                await asyncio.to_thread(self._disk_set, taxcode, business_name, ttl)
+            except Exception as e:
+                logger.error(f"Không thể ghi bộ nhớ đệm mã số thuế: {str(e)}")
+
+    async def _fetch(self, taxcode: str) -> str:
+        """Ask VietQR once; network errors and timeouts are raised and never cached"""
+        self.fetched += 1
+        try:
+            response = await asyncio.wait_for(get_external_client().get(f"{self.url}/{taxcode}"), timeout=self.timeout)
+            response.raise_for_status()
+            data = response.json()
+        except (httpx.HTTPError, asyncio.TimeoutError, ValueError) as e:
+            logger.error(f"Error calling VietQR API: {type(e).__name__} {str(e)}")
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="Không thể xác minh mã số thuế. Vui lòng thử lại sau"
+            )
+        business_name = (data.get("data") or {}).get("name") if data.get("code") == "00" else None
+        await self._remember(taxcode, business_name or _INVALID)
+        if business_name:
+            logger.info(f"Found business: {business_name} for taxcode: {taxcode}")
+        return business_name or _INVALID
+
+    async def lookup(self, taxcode: str) -> str:
+        """Return the business name for a taxcode, raising 400 for invalid codes"""
+        taxcode = taxcode.strip()
+        if not TAXCODE_PATTERN.match(taxcode):
+            raise _invalid_taxcode()
+
+        business_name = await self._cached(taxcode)
+        if business_name is None:
+            task = self._inflight.get(taxcode)
+            if task is not None:
+                self.coalesced += 1
+            else:
+                task = asyncio.create_task(self._fetch(taxcode))
+                task.add_done_callback(lambda _: self._inflight.pop(taxcode, None))
+                self._inflight[taxcode] = task
+            business_name = await asyncio.shield(task)
+
+        if business_name == _INVALID:
+            raise _invalid_taxcode()
+        return business_name
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self._memory.stats(),
+            "disk_enabled": self._store is not None,
+            "disk_hits": self.disk_hits,
+            "fetched": self.fetched,
+            "coalesced": self.coalesced,
+            "inflight": len(self._inflight)
+        }
+
+    def close(self) -> None:
+        if self._store is not None:
+            self._store.close()
+
+taxcode_lookup = TaxcodeLookup(
+    url=settings.VIETQR_BUSINESS_URL,
+    timeout=settings.VIETQR_TIMEOUT,
+    ttl=settings.TAXCODE_CACHE_TTL,
+    negative_ttl=settings.TAXCODE_NEGATIVE_TTL,
+    maxsize=settings.TAXCODE_CACHE_MAXSIZE,
+    path=settings.TAXCODE_CACHE_PATH or None
+)
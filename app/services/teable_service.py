@@ -1,19 +1,32 @@
 import json
-import requests
+import uuid
+import asyncio
+import httpx
 import logging
 import base64
-import tempfile
-import os
-from typing import Dict, Any, Optional
+from typing import Dict, Any, AsyncIterator, List, Optional, Set, Tuple
 from app.core.config import settings
+from app.core.http_client import get_teable_client
+from app.utils.cache import TTLCache
 
 logger = logging.getLogger(__name__)
 
-def handle_teable_api_call(method: str, url: str, **kwargs) -> Dict[str, Any]:
+# Decoded bytes per chunk when streaming attachments
+ATTACHMENT_CHUNK_SIZE = 64 * 1024
+
+# Record IDs per lookup request, keeping the query string well under URL length limits
+RECORD_IDS_PER_REQUEST = 100
+
+# Cache of user-account records from the global user table, keyed by username
+user_record_cache = TTLCache(maxsize=settings.USER_CACHE_MAXSIZE, ttl=settings.USER_CACHE_TTL)
+# Record ID -> username for cached records, bounded and expired alongside the user cache
+_user_record_ids = TTLCache(maxsize=settings.USER_CACHE_MAXSIZE, ttl=settings.USER_CACHE_TTL)
+
+async def handle_teable_api_call(method: str, url: str, **kwargs) -> Dict[str, Any]:
     """Handle Teable API calls with proper error handling and logging"""
     try:
         logger.info(f"Making {method} request to: {url}")
-        response = requests.request(method, url, **kwargs)
+        response = await get_teable_client().request(method, url, **kwargs)
         logger.info(f"Response status code: {response.status_code}")
         logger.info(f"Response headers: {dict(response.headers)}")
         
@@ -33,7 +46,7 @@ def handle_teable_api_call(method: str, url: str, **kwargs) -> Dict[str, Any]:
             logger.error(f"Lỗi: {error_message}")
             logger.error(f"Phản hồi đầy đủ: {response_data}")
             return {"success": False, "status_code": response.status_code, "error": error_message, "detail": response_data}
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         error_message = f"Lỗi mạng trong quá trình gọi API: {str(e)}"
         logger.error(error_message)
         return {"success": False, "error": error_message, "details": {"exception_type": type(e).__name__, "exception_message": str(e)}}
@@ -42,62 +55,316 @@ def handle_teable_api_call(method: str, url: str, **kwargs) -> Dict[str, Any]:
         logger.error(error_message)
         return {"success": False, "error": error_message, "details": {"exception_type": type(e).__name__, "exception_message": str(e)}}
 
-def create_table(base_id: str, payload: dict, headers: dict) -> Optional[str]:
+async def get_user_record(username: str, fresh: bool = False) -> Dict[str, Any]:
+    """Get a user-account record by username, served from the user cache unless `fresh` is set"""
+    record = None if fresh else user_record_cache.get(username)
+    if record is not None:
+        return {"success": True, "status_code": 200, "record": record}
+
+    url = f"{settings.TEABLE_BASE_URL}/table/{settings.TEABLE_TABLE_ID}/record"
+    params = {
+        "fieldKeyType": "dbFieldName",
+        "filter": json.dumps({"conjunction": "and", "filterSet": [{"fieldId": "username", "operator": "is", "value": username}]})
+    }
+    result = await handle_teable_api_call("GET", url, params=params, headers={"Authorization": settings.TEABLE_TOKEN, "Accept": "application/json"})
+    if not result["success"]:
+        return result
+
+    records = result["data"].get("records", [])
+    record = records[0] if records else None
+    if record is not None:
+        user_record_cache.set(username, record)
+        _user_record_ids.set(record["id"], username)
+    return {"success": True, "status_code": 200, "record": record}
+
+def invalidate_user_record(record_id: str) -> None:
+    """Drop a cached user-account record after it has been written to"""
+    username = _user_record_ids.pop(record_id, None)
+    if username is not None:
+        user_record_cache.pop(username)
+
+# User-record fields patched into the cached record after a write instead of evicting it, so frequent
+# bookkeeping writes (last_login on every signin) do not empty the user cache
+_IN_PLACE_USER_FIELDS = {"last_login"}
+
+def apply_user_record_update(record_id: str, fields: dict) -> None:
+    """Bring a cached user-account record in line with a successful write to it"""
+    if not set(fields) <= _IN_PLACE_USER_FIELDS:
+        invalidate_user_record(record_id)
+        return
+    username = _user_record_ids.get(record_id)
+    record = user_record_cache.get(username) if username is not None else None
+    if record is not None:
+        record.setdefault("fields", {}).update(fields)
+
+async def create_records(table_id: str, records_fields: List[dict]) -> Dict[str, Any]:
+    """Create many records in one request, returning them in input order"""
+    url = f"{settings.TEABLE_BASE_URL}/table/{table_id}/record"
+    payload = {
+        "fieldKeyType": "dbFieldName",
+        "typecast": True,
+        "records": [{"fields": fields} for fields in records_fields]
+    }
+    headers = {"Authorization": settings.TEABLE_TOKEN, "Content-Type": "application/json", "Accept": "application/json"}
+    try:
+        response = await get_teable_client().post(url, json=payload, headers=headers)
+    except httpx.HTTPError as e:
+        return {"success": False, "error": f"Lỗi mạng trong quá trình gọi API: {str(e)}"}
+    if response.status_code != 201:
+        return {"success": False, "status_code": response.status_code, "error": response.text}
+    return {"success": True, "status_code": response.status_code, "records": response.json().get("records", [])}
+
+async def _get_records_page(url: str, headers: dict, params: dict) -> List[Dict[str, Any]]:
+    response = await get_teable_client().get(url, params=params, headers=headers)
+    if response.status_code != 200:
+        raise httpx.HTTPStatusError(f"Gọi API thất bại với mã trạng thái {response.status_code}: {response.text}", request=response.request, response=response)
+    return response.json().get("records", [])
+
+async def iter_record_pages(table_id: str, page_size: int = 1000, params: Optional[dict] = None) -> AsyncIterator[List[Dict[str, Any]]]:
+    """Yield a table's records page by page with take/skip, fetching the next page while the current one is consumed"""
+    url = f"{settings.TEABLE_BASE_URL}/table/{table_id}/record"
+    headers = {"Authorization": settings.TEABLE_TOKEN, "Accept": "application/json"}
+
+    def fetch(skip: int) -> asyncio.Task:
+        return asyncio.create_task(_get_records_page(url, headers, {**(params or {}), "fieldKeyType": "dbFieldName", "take": page_size, "skip": skip}))
+
+    skip, task = 0, fetch(0)
+    try:
+        while task is not None:
+            records = await task
+            skip += page_size
+            # A short page is the last one
+            task = fetch(skip) if len(records) == page_size else None
+            if records:
+                yield records
+    finally:
+        if task is not None:
+            task.cancel()
+
+async def iter_records(table_id: str, page_size: int = 1000, params: Optional[dict] = None) -> AsyncIterator[Dict[str, Any]]:
+    """Yield every record of a table, one page in memory plus the prefetched next one"""
+    async for records in iter_record_pages(table_id, page_size, params):
+        for record in records:
+            yield record
+
+async def get_records_by_ids(table_id: str, record_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+    """Fetch specific records with a few concurrent list requests, keyed by record ID"""
+    url = f"{settings.TEABLE_BASE_URL}/table/{table_id}/record"
+    headers = {"Authorization": settings.TEABLE_TOKEN, "Accept": "application/json"}
+    chunks = [record_ids[start:start + RECORD_IDS_PER_REQUEST] for start in range(0, len(record_ids), RECORD_IDS_PER_REQUEST)]
+    semaphore = asyncio.Semaphore(settings.TEABLE_BATCH_CONCURRENCY)
+
+    async def fetch(chunk: List[str]) -> List[Dict[str, Any]]:
+        async with semaphore:
+            return await _get_records_page(url, headers, {"fieldKeyType": "dbFieldName", "take": len(chunk), "selectedRecordIds": chunk})
+
+    pages = await asyncio.gather(*(fetch(chunk) for chunk in chunks))
+    return {record["id"]: record for records in pages for record in records}
+
+async def delete_records(table_id: str, record_ids: List[str]) -> Dict[str, Any]:
+    """Delete records in chunked bulk requests, reporting the record IDs that could not be deleted"""
+    url = f"{settings.TEABLE_BASE_URL}/table/{table_id}/record"
+    headers = {"Authorization": settings.TEABLE_TOKEN, "Accept": "application/json"}
+    failed: Dict[str, str] = {}
+    for start in range(0, len(record_ids), RECORD_IDS_PER_REQUEST):
+        chunk = record_ids[start:start + RECORD_IDS_PER_REQUEST]
+        try:
+            response = await get_teable_client().delete(url, params={"recordIds": chunk}, headers=headers)
+            error = None if response.status_code == 200 else f"Gọi API thất bại với mã trạng thái {response.status_code}: {response.text}"
+        except httpx.HTTPError as e:
+            error = f"Lỗi mạng trong quá trình gọi API: {str(e)}"
+        if error:
+            logger.error(f"Không thể xóa {len(chunk)} bản ghi trong bảng {table_id}: {error}")
+            failed.update({record_id: error for record_id in chunk})
+    return {"success": not failed, "failed": failed}
+
+async def _patch_chunk(url: str, headers: dict, chunk: List[Tuple[str, dict]]) -> Optional[str]:
+    payload = {
+        "fieldKeyType": "dbFieldName",
+        "typecast": True,
+        "records": [{"id": record_id, "fields": fields} for record_id, fields in chunk]
+    }
+    try:
+        response = await get_teable_client().patch(url, json=payload, headers=headers)
+    except httpx.HTTPError as e:
+        return f"Lỗi mạng trong quá trình gọi API: {str(e)}"
+    return None if response.status_code == 200 else f"Gọi API thất bại với mã trạng thái {response.status_code}: {response.text}"
+
+async def update_records(table_id: str, updates: List[Tuple[str, dict]]) -> Dict[str, Any]:
+    """Update many records with chunked bulk PATCH requests sent concurrently, reporting the record IDs that failed"""
+    url = f"{settings.TEABLE_BASE_URL}/table/{table_id}/record"
+    headers = {"Authorization": settings.TEABLE_TOKEN, "Content-Type": "application/json", "Accept": "application/json"}
+
+    # A record may appear only once per request, so repeated updates are merged with later fields winning
+    merged: Dict[str, dict] = {}
+    for record_id, fields in updates:
+        merged[record_id] = {**merged.get(record_id, {}), **fields}
+    items = list(merged.items())
+    chunks = [items[start:start + settings.TEABLE_BATCH_SIZE] for start in range(0, len(items), settings.TEABLE_BATCH_SIZE)]
+    semaphore = asyncio.Semaphore(settings.TEABLE_BATCH_CONCURRENCY)
+
+    async def send(chunk: List[Tuple[str, dict]]) -> Optional[str]:
+        async with semaphore:
+            return await _patch_chunk(url, headers, chunk)
+
+    failed: Dict[str, str] = {}
+    for chunk, error in zip(chunks, await asyncio.gather(*(send(chunk) for chunk in chunks))):
+        if error:
+            logger.error(f"Không thể cập nhật {len(chunk)} bản ghi trong bảng {table_id}: {error}")
+            failed.update({record_id: error for record_id, _ in chunk})
+    if table_id == settings.TEABLE_TABLE_ID:
+        for record_id, fields in merged.items():
+            if record_id not in failed:
+                apply_user_record_update(record_id, fields)
+            elif not set(fields) <= _IN_PLACE_USER_FIELDS:
+                invalidate_user_record(record_id)
+    return {"success": not failed, "updated": len(merged) - len(failed), "failed": failed}
+
+_SHUTDOWN_ERROR = "Máy chủ đang tắt, bản ghi chưa được cập nhật"
+
+class RecordWriteBatcher:
+    """Merges single-record updates issued close together into bulk PATCH requests, one per table"""
+
+    def __init__(self, window: float):
+        self.window = window
+        self.requested = 0
+        self.flushed = 0
+        self._pending: Dict[str, Dict[str, Tuple[dict, List[asyncio.Future]]]] = {}
+        self._flushers: Dict[str, asyncio.Task] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def update(self, table_id: str, record_id: str, fields: dict) -> Optional[str]:
+        """Queue one record update and wait for its bulk write, returning the error or None"""
+        self.requested += 1
+        if self.window <= 0:
+            return (await update_records(table_id, [(record_id, fields)]))["failed"].get(record_id)
+
+        future = asyncio.get_running_loop().create_future()
+        table = self._pending.setdefault(table_id, {})
+        merged, waiters = table.get(record_id, ({}, []))
+        table[record_id] = ({**merged, **fields}, waiters + [future])
+        if table_id not in self._flushers:
+            task = asyncio.create_task(self._flush(table_id))
+            self._flushers[table_id] = task
+            # Tracked until done, as a flush leaves _flushers once its write starts
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        return await future
+
+    async def _write(self, table_id: str, updates: Dict[str, dict]) -> Dict[str, str]:
+        failed = (await update_records(table_id, list(updates.items())))["failed"]
+        if failed and len(updates) > 1:
+            # A bulk PATCH fails as a whole, so retry its records one by one to keep one bad record from failing the rest
+            record_ids = list(failed)
+            retried = await asyncio.gather(*(update_records(table_id, [(record_id, updates[record_id])]) for record_id in record_ids))
+            failed = {record_id: result["failed"][record_id] for record_id, result in zip(record_ids, retried) if record_id in result["failed"]}
+        return failed
+
+    @staticmethod
+    def _resolve(batch: Dict[str, Tuple[dict, List[asyncio.Future]]], failed: Dict[str, str]) -> None:
+        for record_id, (_, waiters) in batch.items():
+            for future in waiters:
+                if not future.done():
+                    future.set_result(failed.get(record_id))
+
+    async def _flush(self, table_id: str) -> None:
+        await asyncio.sleep(self.window)
+        # Updates arriving from here on start the next batch
+        batch = self._pending.pop(table_id, {})
+        self._flushers.pop(table_id, None)
+        self.flushed += 1
+        failed: Dict[str, str] = {}
+        try:
+            failed = await self._write(table_id, {record_id: fields for record_id, (fields, _) in batch.items()})
+        except asyncio.CancelledError:
+            failed = {record_id: _SHUTDOWN_ERROR for record_id in batch}
+            raise
+        except Exception as e:
+            failed = {record_id: f"Lỗi không mong muốn trong quá trình gọi API: {str(e)}" for record_id in batch}
+        finally:
+            self._resolve(batch, failed)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"requested": self.requested, "flushed": self.flushed, "pending": sum(len(t) for t in self._pending.values())}
+
+    async def stop(self) -> None:
+        """Cancel scheduled flushes and fail every update still waiting, so no caller hangs at shutdown"""
+        flushers = list(self._tasks)
+        for task in flushers:
+            task.cancel()
+        await asyncio.gather(*flushers, return_exceptions=True)
+        self._flushers.clear()
+        for batch in self._pending.values():
+            self._resolve(batch, {record_id: _SHUTDOWN_ERROR for record_id in batch})
+        self._pending.clear()
+
+record_writer = RecordWriteBatcher(settings.TEABLE_WRITE_COALESCE_WINDOW)
+
+async def create_table(base_id: str, payload: dict, headers: dict) -> Optional[str]:
     """Create a table in Teable"""
     url = f"{settings.TEABLE_BASE_URL}/base/{base_id}/table/"
-    response = requests.post(url, data=json.dumps(payload), headers=headers)
+    response = await get_teable_client().post(url, json=payload, headers=headers)
     if response.status_code != 201:
         logger.error(f"Không thể tạo bảng: {response.text}")
         return None
     return response.json()["id"]
 
-def update_user_table_id(table_order_id: str = settings.TEABLE_TABLE_ID, record_order_id: str = '', update_fields: dict = '') -> bool:
-    """Update user table with new field values"""
-    headers_teable = {
+async def update_user_table_id(table_order_id: str = settings.TEABLE_TABLE_ID, record_order_id: str = '', update_fields: dict = '') -> bool:
+    """Update user table with new field values (coalesced into bulk PATCH requests when TEABLE_WRITE_COALESCE_WINDOW is set)"""
+    return await record_writer.update(table_order_id, record_order_id, update_fields) is None
+
+def _base64_decoded_length(data: str) -> int:
+    """Exact decoded size of a padded base64 string"""
+    return len(data) // 4 * 3 - data[-2:].count("=") if data else 0
+
+async def _iter_base64_decoded(data: str, chunk_size: int = ATTACHMENT_CHUNK_SIZE) -> AsyncIterator[bytes]:
+    """Decode base64 incrementally, a few KB at a time, instead of materialising the whole file"""
+    step = chunk_size // 3 * 4
+    for offset in range(0, len(data), step):
+        yield base64.b64decode(data[offset:offset + step])
+
+def _multipart_attachment(file_to_bytes: str, file_name: str, content_type: str) -> Tuple[Dict[str, str], AsyncIterator[bytes]]:
+    """Build a streaming multipart/form-data body for a base64-encoded file"""
+    boundary = uuid.uuid4().hex
+    safe_name = (file_name or "invoice.pdf").replace("\\", "\\\\").replace('"', "%22")
+    head = (
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="file"; filename="{safe_name}"\r\n'
+        f"Content-Type: {content_type}\r\n\r\n"
+    ).encode("utf-8")
+    tail = f"\r\n--{boundary}--\r\n".encode("utf-8")
+
+    async def body() -> AsyncIterator[bytes]:
+        yield head
+        async for chunk in _iter_base64_decoded(file_to_bytes):
+            yield chunk
+        yield tail
+
+    headers = {
+        "Content-Type": f"multipart/form-data; boundary={boundary}",
+        "Content-Length": str(len(head) + _base64_decoded_length(file_to_bytes) + len(tail))
+    }
+    return headers, body()
+
+async def upload_attachment_to_teable(field_id: str, record_id: str, table_id: str, file_to_bytes: str, file_name: str):
+    """Upload attachment to Teable, streaming the decoded file straight into the request body"""
+    # Strip line breaks some encoders insert so chunks stay aligned on 4-character groups
+    if "\n" in file_to_bytes or "\r" in file_to_bytes:
+        file_to_bytes = "".join(file_to_bytes.split())
+
+    multipart_headers, body = _multipart_attachment(file_to_bytes, file_name, "application/pdf")
+    headers = {
         "Authorization": f"{settings.TEABLE_TOKEN}",
-        "Content-Type": "application/json"
+        "Accept": "application/json",
+        **multipart_headers
     }
-    update_url = f"{settings.TEABLE_BASE_URL}/table/{table_order_id}/record/{record_order_id}"
-    update_payload = json.dumps({
-        "fieldKeyType": "dbFieldName",
-        "typecast": True,
-        "record": {"fields": update_fields}
-    })
-    response = requests.patch(update_url, data=update_payload, headers=headers_teable)
-    return response.status_code == 200
-
-def upload_attachment_to_teable(field_id: str, record_id: str, table_id: str, file_to_bytes: str, file_name: str):
-    """Upload attachment to Teable"""
-    # Tạo file tạm từ base64
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as temp_file:
-        temp_file.write(base64.b64decode(file_to_bytes))
-        temp_file_path = temp_file.name
-        print(f"✅ Đã tạo file tạm tại: {temp_file_path}")
 
+    url = f"{settings.TEABLE_BASE_URL}/table/{table_id}/record/{record_id}/{field_id}/uploadAttachment"
     try:
-        with open(temp_file_path, "rb") as f:
-            files = {
-                "file": (file_name, f, "application/pdf")
-            }
-
-            headers = {
-                "Authorization": f"{settings.TEABLE_TOKEN}",
-                "Accept": "application/json"
-            }
-
-            url = f"{settings.TEABLE_BASE_URL}/table/{table_id}/record/{record_id}/{field_id}/uploadAttachment"
-            response = requests.post(url, headers=headers, files=files)
-            response.raise_for_status()
-
-            print("✅ Upload thành công.")
-            return response.json()
+        response = await get_teable_client().post(url, headers=headers, content=body)
+        response.raise_for_status()
+        logger.info(f"Uploaded attachment {file_name} to record {record_id}")
+        return response.json()
     except Exception as e:
-        print(f"❌ Lỗi khi upload: {e}")
+        logger.error(f"Lỗi khi upload file {file_name}: {str(e)}")
         raise
-    finally:
-        # Luôn xóa file tạm
-        try:
-            os.remove(temp_file_path)
-            print(f"🧹 Đã xoá file tạm: {temp_file_path}")
-        except Exception as cleanup_error:
-            print(f"⚠️ Không thể xoá file tạm: {cleanup_error}")
@@ -0,0 +1,129 @@
+import json
+import time
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from app.core.config import settings
+from app.services.extraction_cache import is_valid_extraction
+from app.utils.cache import TTLCache
+from app.utils.sqlite_store import SQLiteStore
+
+logger = logging.getLogger(__name__)
+
+TRANSCRIPTION_CACHE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS transcription_cache (
+    digest TEXT PRIMARY KEY,
+    result TEXT NOT NULL,
+    expires_at REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_transcription_cache_last_access ON transcription_cache (last_access);
+"""
+
+class TranscriptionCache:
+    """Results of transcribe-and-extract keyed by audio hash, in memory and in SQLite, with single-flight"""
+
+    def __init__(self, ttl: float, memory_size: int, path: Optional[str] = None, disk_size: int = 10000):
+        self.ttl = ttl
+        self.disk_size = disk_size
+        self.disk_hits = 0
+        self.coalesced = 0
+        self._memory = TTLCache(maxsize=memory_size, ttl=ttl)
+        self._store = SQLiteStore(path, TRANSCRIPTION_CACHE_SCHEMA) if path else None
+        self._inflight: Dict[str, asyncio.Task] = {}
+
+    def _disk_get(self, digest: str) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        rows = self._store.execute("SELECT result, expires_at FROM transcription_cache WHERE digest = ?", (digest,))
+        if not rows:
+            return None
+        result, expires_at = rows[0]
+        if expires_at <= now:
+            self._store.execute("DELETE FROM transcription_cache WHERE digest = ?", (digest,))
+            return None
+        self._store.execute("UPDATE transcription_cache SET last_access = ? WHERE digest = ?", (now, digest))
+        return json.loads(result)
+
+    def _disk_set(self, digest: str, result: Dict[str, Any]) -> None:
+        now = time.time()
+        with self._store.transaction() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO transcription_cache (digest, result, expires_at, last_access) VALUES (?, ?, ?, ?)",
+                (digest, json.dumps(result, ensure_ascii=False), now + self.ttl, now)
+            )
+            conn.execute("DELETE FROM transcription_cache WHERE expires_at <= ?", (now,))
+            conn.execute(
+                "DELETE FROM transcription_cache WHERE digest IN "
+                "(SELECT digest FROM transcription_cache ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                (self.disk_size,)
+            )
+
+    async def get(self, digest: str) -> Optional[Dict[str, Any]]:
+        result = self._memory.get(digest)
+        if result is None and self._store is not None:
+            try:
+                result = await asyncio.to_thread(self._disk_get, digest)
+            except Exception as e:
+                logger.error(f"Không thể đọc bộ nhớ đệm nhận dạng giọng nói: {str(e)}")
+            if result is not None:
+                self.disk_hits += 1
+                self._memory.set(digest, result)
+        return result
+
+    async def set(self, digest: str, result: Dict[str, Any]) -> None:
+        self._memory.set(digest, result)
+        if self._store is not None:
+            try:
+                await asyncio.to_thread(self._disk_set, digest, result)
+            except Exception as e:
+                logger.error(f"Không thể ghi bộ nhớ đệm nhận dạng giọng nói: {str(e)}")
+
+    async def get_or_compute(self, digest: str, compute: Callable[[], Awaitable[Dict[str, Any]]]) -> Tuple[Dict[str, Any], bool]:
+        """Return (result, cached); concurrent calls for the same digest share one computation"""
+        result = await self.get(digest)
+        if result is not None:
+            return result, True
+
+        task = self._inflight.get(digest)
+        if task is not None:
+            self.coalesced += 1
+            return await asyncio.shield(task), True
+
+        async def run() -> Dict[str, Any]:
+            try:
+                result = await compute()
+                # Transcription and extraction errors are never cached so a retry gets a fresh attempt
+                if "lỗi" not in result and is_valid_extraction(result.get("extracted")):
+                    await self.set(digest, result)
+                return result
+            finally:
+                self._inflight.pop(digest, None)
+
+        task = asyncio.create_task(run())
+        self._inflight[digest] = task
+        return await asyncio.shield(task), False
+
+    def stats(self) -> Dict[str, Any]:
+        stats = self._memory.stats()
+        memory_hits = stats["hits"]
+        total = memory_hits + stats["misses"]
+        hits = memory_hits + self.disk_hits
+        return {
+            **stats,
+            "disk_enabled": self._store is not None,
+            "disk_hits": self.disk_hits,
+            "coalesced": self.coalesced,
+            "inflight": len(self._inflight),
+            "hit_rate": round(hits / total, 4) if total else 0.0
+        }
+
+    def close(self) -> None:
+        if self._store is not None:
+            self._store.close()
+
+transcription_cache = TranscriptionCache(
+    ttl=settings.TRANSCRIPTION_CACHE_TTL,
+    memory_size=settings.TRANSCRIPTION_CACHE_MAXSIZE,
+    path=settings.TRANSCRIPTION_CACHE_PATH or None,
+    disk_size=settings.TRANSCRIPTION_CACHE_DISK_MAXSIZE
+)
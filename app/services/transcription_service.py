@@ -1,24 +1,186 @@
-from faster_whisper import WhisperModel
-from tempfile import NamedTemporaryFile
+import asyncio
+import hashlib
+import logging
+from typing import Any, Dict, List, Optional
+import numpy as np
+from fastapi import HTTPException, UploadFile, WebSocket, WebSocketDisconnect
+from app.core.config import settings
+from app.core.security import get_websocket_tenant
 from app.extractor import extract_info_from_text
+from app.services.whisper_pool import whisper_pool
+from app.services.transcription_cache import transcription_cache
+from app.services.catalog_index import catalog_index
+from app.utils.audio import AudioTooLongError, decode_audio, rms
+from app.utils.vad import SpeechSegmenter
 
-# Initialize Whisper model
-whisper_model = WhisperModel("small", compute_type="int8", device="cpu")
+logger = logging.getLogger(__name__)
 
-async def transcribe_and_extract_service(file_content: bytes) -> dict:
-    """Transcribe audio file and extract information"""
+STREAM_SAMPLE_RATE = 16000
+_HASH_CHUNK_SIZE = 1024 * 1024
+
+async def load_audio(file: UploadFile) -> np.ndarray:
+    """Decode an upload in memory to 16 kHz mono float32, rejecting overlong or silent clips"""
+    await file.seek(0)
+    try:
+        samples = await asyncio.to_thread(decode_audio, file.file, STREAM_SAMPLE_RATE, settings.AUDIO_MAX_DURATION_S)
+    except AudioTooLongError:
+        raise HTTPException(status_code=413, detail="Đoạn ghi âm vượt quá thời lượng cho phép")
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Không đọc được file âm thanh: {str(e)}")
+
+    if rms(samples) < settings.AUDIO_SILENCE_THRESHOLD:
+        raise HTTPException(status_code=422, detail="Không phát hiện giọng nói trong file âm thanh")
+    return samples
+
+def _hash_upload(file: UploadFile) -> str:
+    file.file.seek(0)
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: file.file.read(_HASH_CHUNK_SIZE), b""):
+        digest.update(chunk)
+    file.file.seek(0)
+    return digest.hexdigest()
+
+async def transcribe_and_extract_service(file: UploadFile, username: Optional[str] = None) -> dict:
+    """Transcribe audio file and extract information, reusing the result of an identical earlier upload"""
+    if file.size is not None and file.size > settings.AUDIO_MAX_BYTES:
+        raise HTTPException(status_code=413, detail="File âm thanh vượt quá dung lượng cho phép")
+    digest = await asyncio.to_thread(_hash_upload, file)
+    # Results carry tenant-specific catalog matches, so tenants never share entries
+    if username:
+        digest = f"{username}:{digest}"
+    result, cached = await transcription_cache.get_or_compute(digest, lambda: _transcribe_and_extract(file, username))
+    return {**result, "cached": cached}
+
+async def _transcribe_and_extract(file: UploadFile, username: Optional[str]) -> dict:
+    samples = await load_audio(file)
     try:
-        with NamedTemporaryFile(suffix=".webm", delete=True) as temp_audio:
-            temp_audio.write(file_content)
-            temp_audio.flush()
-            segments, info = whisper_model.transcribe(temp_audio.name, beam_size=5, vad_filter=True)
-            text_result = " ".join([segment.text.strip() for segment in segments])
-        
-        extracted_json = extract_info_from_text(text_result)
+        transcription = await whisper_pool.transcribe(samples)
+        if "error" in transcription:
+            return {"lỗi": transcription["error"]}
+
+        text_result = transcription["text"]
+        extracted_json = await catalog_index.enrich(username, await extract_info_from_text(text_result, username))
         return {
-            "language": info.language, 
-            "transcription": text_result.strip(), 
-            "extracted": extracted_json
+            "language": transcription["language"],
+            "transcription": text_result.strip(),
+            "extracted": extracted_json,
+            "tier": transcription["tier"]
         }
+    except HTTPException:
+        raise
     except Exception as e:
         return {"lỗi": str(e)}
+
+class _StreamSession:
+    """One WebSocket stream: segments are transcribed as soon as VAD closes them"""
+
+    def __init__(self, websocket: WebSocket, username: Optional[str]):
+        self.websocket = websocket
+        self.username = username
+        self.segmenter = SpeechSegmenter(
+            sample_rate=STREAM_SAMPLE_RATE,
+            frame_ms=settings.STREAM_VAD_FRAME_MS,
+            threshold=settings.STREAM_VAD_THRESHOLD,
+            silence_ms=settings.STREAM_SILENCE_MS,
+            min_segment_ms=settings.STREAM_MIN_SEGMENT_MS,
+            max_segment_ms=settings.STREAM_MAX_SEGMENT_MS
+        )
+        self.results: List[Optional[Dict[str, Any]]] = []
+        self.tasks: List[asyncio.Task] = []
+        self._item_sends: List[asyncio.Task] = []
+        self._send_lock = asyncio.Lock()
+
+    async def send(self, message: dict) -> None:
+        async with self._send_lock:
+            await self.websocket.send_json(message)
+
+    def transcription(self) -> str:
+        return " ".join(r["text"] for r in self.results if r and r.get("text"))
+
+    def schedule(self, segment: Optional[np.ndarray]) -> None:
+        if segment is None:
+            return
+        self.results.append(None)
+        self.tasks.append(asyncio.create_task(self._transcribe_segment(len(self.results) - 1, segment)))
+
+    async def _transcribe_segment(self, index: int, segment: np.ndarray) -> None:
+        try:
+            result = await whisper_pool.transcribe(segment)
+        except HTTPException as e:
+            result = {"error": str(e.detail)}
+        self.results[index] = result
+        if "error" in result:
+            await self.send({"type": "error", "segment": index, "detail": result["error"]})
+        else:
+            await self.send({"type": "partial", "segment": index, "text": result["text"], "transcription": self.transcription(), "tier": result["tier"]})
+
+    def _send_item(self, item: Dict[str, Any]) -> None:
+        # Items parsed from the streamed LLM answer are forwarded before the final message
+        self._item_sends.append(asyncio.create_task(self.send({"type": "item", "item": item})))
+
+    def cancel(self) -> None:
+        for task in self.tasks:
+            task.cancel()
+
+    async def finish(self) -> None:
+        self.schedule(self.segmenter.flush())
+        await asyncio.gather(*self.tasks)
+
+        errors = [r["error"] for r in self.results if r and "error" in r]
+        if errors:
+            await self.send({"type": "error", "detail": errors[0]})
+            return
+
+        text_result = self.transcription()
+        language = next((r["language"] for r in self.results if r), None)
+        extracted_json = await extract_info_from_text(text_result, self.username, self._send_item) if text_result else []
+        extracted_json = await catalog_index.enrich(self.username, extracted_json)
+        await asyncio.gather(*self._item_sends)
+        await self.send({
+            "type": "final",
+            "language": language,
+            "transcription": text_result,
+            "extracted": extracted_json
+        })
+
+async def stream_transcribe_and_extract_service(websocket: WebSocket) -> None:
+    """Receive PCM chunks, emit partial transcripts per speech segment and extract the order when the client sends "end" """
+    try:
+        tenant = get_websocket_tenant(websocket)
+    except HTTPException as e:
+        # Rejecting before accept refuses the handshake
+        await websocket.close(code=1008, reason=str(e.detail))
+        return
+    await websocket.accept()
+    # ?username= is only honoured for legacy clients without a session token
+    session = _StreamSession(websocket, tenant.username if tenant is not None else websocket.query_params.get("username"))
+    max_samples = settings.STREAM_MAX_DURATION_S * STREAM_SAMPLE_RATE
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                session.cancel()
+                return
+            if message.get("bytes"):
+                for segment in session.segmenter.feed(message["bytes"]):
+                    session.schedule(segment)
+                if session.segmenter.samples > max_samples:
+                    await session.send({"type": "error", "detail": "Đoạn ghi âm vượt quá thời lượng cho phép"})
+                    session.cancel()
+                    await websocket.close(code=1009)
+                    return
+            elif message.get("text") == "end":
+                break
+
+        await session.finish()
+        await websocket.close()
+    except WebSocketDisconnect:
+        session.cancel()
+    except Exception as e:
+        session.cancel()
+        logger.error(f"Lỗi trong phiên nhận dạng giọng nói trực tuyến: {str(e)}")
+        try:
+            await websocket.send_json({"type": "error", "detail": str(e)})
+            await websocket.close(code=1011)
+        except Exception:
+            pass
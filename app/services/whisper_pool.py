@@ -0,0 +1,239 @@
+import io
+import os
+import time
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple, Union
+import numpy as np
+from fastapi import HTTPException, status
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Expected seconds of compute per second of audio on one worker, refined from measurements
+_DEFAULT_RTF = {"tiny": 0.1, "base": 0.2, "small": 0.5, "medium": 1.2, "large-v3": 2.5}
+
+# Loaded once per worker process by _init_worker, keyed by (model_size, compute_type)
+_models: Dict[Tuple[str, str], Any] = {}
+
+def parse_tiers(spec: str) -> List[Dict[str, Any]]:
+    """Parse "small:5:int8,base:2:int8" into tier dicts, most accurate first"""
+    tiers = []
+    for item in spec.split(","):
+        model_size, beam_size, compute_type = (item.strip().split(":") + ["", ""])[:3]
+        tiers.append({"model_size": model_size, "beam_size": int(beam_size or 1), "compute_type": compute_type or "int8"})
+    return tiers
+
+def _load_model(model_size: str, compute_type: str, cpu_threads: int):
+    from faster_whisper import WhisperModel
+    return WhisperModel(model_size, device="cpu", compute_type=compute_type, cpu_threads=cpu_threads)
+
+def _init_worker(tiers: List[Dict[str, Any]], cpu_threads: int, pin_cpus: bool, counter) -> None:
+    """Worker process initializer: pin to a CPU slice and load every tier's model once"""
+    with counter.get_lock():
+        worker_index = counter.value
+        counter.value += 1
+
+    if pin_cpus and hasattr(os, "sched_setaffinity"):
+        cpus = sorted(os.sched_getaffinity(0))
+        start = (worker_index * cpu_threads) % len(cpus)
+        os.sched_setaffinity(0, {cpus[(start + i) % len(cpus)] for i in range(min(cpu_threads, len(cpus)))})
+
+    for tier in tiers:
+        key = (tier["model_size"], tier["compute_type"])
+        if key not in _models:
+            _models[key] = _load_model(tier["model_size"], tier["compute_type"], cpu_threads)
+
+SAMPLE_RATE = 16000
+
+# An encoded audio file, or 16 kHz mono float32 samples
+Clip = Union[bytes, np.ndarray]
+
+def _clip_size(content: Clip) -> int:
+    return content.nbytes if isinstance(content, np.ndarray) else len(content)
+
+def _clip_duration(content: Clip) -> Optional[float]:
+    return len(content) / SAMPLE_RATE if isinstance(content, np.ndarray) else None
+
+def _transcribe_batch(jobs: List[Tuple[Clip, Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """Transcribe several clips, each with its own tier, in one worker round trip"""
+    results = []
+    for content, tier in jobs:
+        started = time.perf_counter()
+        try:
+            model = _models[(tier["model_size"], tier["compute_type"])]
+            audio = content if isinstance(content, np.ndarray) else io.BytesIO(content)
+            segments, info = model.transcribe(audio, beam_size=tier["beam_size"], vad_filter=True)
+            text_result = " ".join([segment.text.strip() for segment in segments])
+            results.append({"language": info.language, "text": text_result.strip(), "duration": info.duration})
+        except Exception as e:
+            results.append({"error": str(e)})
+        results[-1]["elapsed"] = time.perf_counter() - started
+    return results
+
+def _ping() -> int:
+    return os.getpid()
+
+class WhisperPool:
+    """Pool of worker processes holding loaded Whisper models, with load-aware tiering, a bounded queue and micro-batching"""
+
+    def __init__(self, workers: int, tiers: List[Dict[str, Any]], latency_budget: float, cpu_threads: int, pin_cpus: bool,
+                 max_queue: int, batch_size: int, batch_window: float, batch_max_bytes: int):
+        self.workers = workers
+        self.tiers = tiers
+        self.latency_budget = latency_budget
+        self.cpu_threads = cpu_threads
+        self.pin_cpus = pin_cpus
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self.batch_max_bytes = batch_max_bytes
+        self.pending = 0
+        self.processed = 0
+        self.batches = 0
+        self.rtf = {tier["model_size"]: _DEFAULT_RTF.get(tier["model_size"], 1.0) for tier in tiers}
+        self.tier_counts = {tier["model_size"]: 0 for tier in tiers}
+        self._mp_context = multiprocessing.get_context("spawn")
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._batch: List[Tuple[Clip, Dict[str, Any], asyncio.Future]] = []
+        self._batch_timer: Optional[asyncio.TimerHandle] = None
+
+    async def start(self) -> None:
+        """Start the worker processes and wait until each has loaded its model"""
+        if self._executor is not None:
+            return
+        counter = self._mp_context.Value("i", 0)
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=self._mp_context,
+            initializer=_init_worker,
+            initargs=(self.tiers, self.cpu_threads, self.pin_cpus, counter)
+        )
+        loop = asyncio.get_running_loop()
+        try:
+            pids = await asyncio.gather(*(loop.run_in_executor(self._executor, _ping) for _ in range(self.workers)))
+            models = ", ".join(tier["model_size"] for tier in self.tiers)
+            logger.info(f"Whisper pool ready: {len(set(pids))} workers, models={models}")
+        except Exception as e:
+            logger.error(f"Không thể khởi động Whisper worker: {str(e)}")
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def stop(self) -> None:
+        if self._batch_timer is not None:
+            self._batch_timer.cancel()
+            self._batch_timer = None
+        for _, _, future in self._batch:
+            if not future.done():
+                future.cancel()
+        self._batch = []
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self._executor is not None,
+            "workers": self.workers,
+            "pending": self.pending,
+            "max_queue": self.max_queue,
+            "processed": self.processed,
+            "batches": self.batches,
+            "latency_budget": self.latency_budget,
+            "tiers": {
+                name: {"requests": count, "rtf": round(self.rtf[name], 3)} for name, count in self.tier_counts.items()
+            }
+        }
+
+    def select_tier(self, duration: Optional[float]) -> Dict[str, Any]:
+        """Pick the most accurate tier whose estimated latency under the current queue fits the budget"""
+        # Clips of unknown length are costed as one batch-sized clip
+        duration = max(duration or self.batch_max_bytes / 4 / SAMPLE_RATE, 1.0)
+        queue_factor = 1 + self.pending / self.workers
+        for tier in self.tiers:
+            if self.rtf[tier["model_size"]] * duration * queue_factor <= self.latency_budget:
+                return tier
+        return self.tiers[-1]
+
+    def _record_timing(self, tier: Dict[str, Any], result: Dict[str, Any]) -> None:
+        duration = result.get("duration")
+        if "error" in result or not duration or duration < 1.0:
+            return
+        name = tier["model_size"]
+        self.rtf[name] = 0.8 * self.rtf[name] + 0.2 * (result["elapsed"] / duration)
+
+    def _dispatch(self, jobs: List[Tuple[Clip, Dict[str, Any]]], futures: List[asyncio.Future]) -> None:
+        loop = asyncio.get_running_loop()
+        self.batches += 1
+        job = loop.run_in_executor(self._executor, _transcribe_batch, jobs)
+
+        def done(job_future: asyncio.Future) -> None:
+            if job_future.cancelled():
+                for future in futures:
+                    future.cancel()
+                return
+            error = job_future.exception()
+            results = None if error else job_future.result()
+            for index, future in enumerate(futures):
+                if not error:
+                    self._record_timing(jobs[index][1], results[index])
+                if future.done():
+                    continue
+                if error:
+                    future.set_exception(error)
+                else:
+                    future.set_result({**results[index], "tier": jobs[index][1]})
+
+        job.add_done_callback(done)
+
+    def _flush_batch(self) -> None:
+        self._batch_timer = None
+        batch, self._batch = self._batch, []
+        # One job per worker so the batch is decoded on all cores, not one after another on a single worker
+        jobs = min(self.workers, len(batch))
+        for start in range(jobs):
+            part = batch[start::jobs]
+            self._dispatch([(clip, tier) for clip, tier, _ in part], [future for _, _, future in part])
+
+    async def transcribe(self, content: Clip) -> Dict[str, Any]:
+        """Transcribe one clip in a worker process, returning {"language", "text", "tier"} or {"error", "tier"}"""
+        if self._executor is None:
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Dịch vụ nhận dạng giọng nói chưa sẵn sàng")
+        if self.pending >= self.max_queue:
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Hệ thống đang quá tải, vui lòng thử lại sau")
+
+        tier = self.select_tier(_clip_duration(content))
+        self.tier_counts[tier["model_size"]] += 1
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.pending += 1
+        try:
+            if _clip_size(content) <= self.batch_max_bytes and self.batch_size > 1:
+                # Short clips are coalesced into one worker round trip
+                self._batch.append((content, tier, future))
+                if len(self._batch) >= self.batch_size:
+                    if self._batch_timer is not None:
+                        self._batch_timer.cancel()
+                    self._flush_batch()
+                elif self._batch_timer is None:
+                    self._batch_timer = loop.call_later(self.batch_window, self._flush_batch)
+            else:
+                self._dispatch([(content, tier)], [future])
+            return await future
+        finally:
+            self.pending -= 1
+            self.processed += 1
+
+whisper_pool = WhisperPool(
+    workers=settings.WHISPER_WORKERS,
+    tiers=parse_tiers(settings.WHISPER_TIERS),
+    latency_budget=settings.WHISPER_LATENCY_BUDGET_S,
+    cpu_threads=settings.WHISPER_CPU_THREADS,
+    pin_cpus=settings.WHISPER_PIN_CPUS,
+    max_queue=settings.WHISPER_MAX_QUEUE,
+    batch_size=settings.WHISPER_BATCH_SIZE,
+    batch_window=settings.WHISPER_BATCH_WINDOW_MS / 1000,
+    batch_max_bytes=settings.WHISPER_BATCH_MAX_BYTES
+)
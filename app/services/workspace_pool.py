@@ -0,0 +1,119 @@
+import os
+import json
+import uuid
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional
+from app.core.config import settings
+from app.services.teable_service import handle_teable_api_call
+from app.services.provisioning_service import PROVISIONING_STEPS, PROGRESS_FIELDS, run_step_graph
+
+logger = logging.getLogger(__name__)
+
+class WorkspacePool:
+    """Keeps a number of ready-made tenant workspaces that signup can claim instantly"""
+
+    def __init__(self, size: int, path: str, retry_delay: float = 30.0):
+        self.size = size
+        self.path = path
+        self.retry_delay = retry_delay
+        self.claimed = 0
+        self.created = 0
+        self.failed = 0
+        self._entries: List[Dict[str, Any]] = self._load()
+        self._refill_needed = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def _load(self) -> List[Dict[str, Any]]:
+        if not os.path.exists(self.path):
+            return []
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logger.error(f"Không thể đọc warm pool từ {self.path}: {str(e)}")
+            return []
+
+    def _save(self) -> None:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._entries, f)
+        os.replace(tmp_path, self.path)
+
+    @property
+    def depth(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.size > 0,
+            "target_size": self.size,
+            "depth": self.depth,
+            "created": self.created,
+            "claimed": self.claimed,
+            "failed": self.failed,
+        }
+
+    def claim(self) -> Optional[Dict[str, Any]]:
+        """Take a ready workspace out of the pool and schedule a refill"""
+        if not self._entries:
+            return None
+        entry = self._entries.pop(0)
+        self._save()
+        self.claimed += 1
+        self._refill_needed.set()
+        return entry
+
+    async def _provision_one(self) -> Dict[str, Any]:
+        async def noop(step: str, outputs: dict) -> None:
+            return None
+
+        ctx = await run_step_graph(PROVISIONING_STEPS, {"business_name": f"pool_{uuid.uuid4().hex[:8]}"}, noop)
+        return {key: ctx.get(key, "") for key in PROGRESS_FIELDS}
+
+    async def _refill_loop(self) -> None:
+        while True:
+            while self.depth < self.size:
+                try:
+                    entry = await self._provision_one()
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    self.failed += 1
+                    logger.error(f"Không thể tạo workspace cho warm pool: {str(e)}")
+                    await asyncio.sleep(self.retry_delay)
+                    continue
+                self._entries.append(entry)
+                self._save()
+                self.created += 1
+                logger.info(f"Warm pool depth: {self.depth}/{self.size}")
+            self._refill_needed.clear()
+            await self._refill_needed.wait()
+
+    def start(self) -> None:
+        """Start the background refill task (no-op when the pool is disabled)"""
+        if self.size > 0 and self._task is None:
+            self._task = asyncio.create_task(self._refill_loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+async def rename_workspace(space_id: str, base_id: str, business_name: str) -> None:
+    """Rename a claimed pool workspace after its new owner"""
+    headers = {"Authorization": settings.TEABLE_TOKEN, "Accept": "application/json", "Content-Type": "application/json"}
+    results = await asyncio.gather(
+        handle_teable_api_call("PATCH", f"{settings.TEABLE_BASE_URL}/space/{space_id}", json={"name": f"{business_name}_workspace"}, headers=headers),
+        handle_teable_api_call("PATCH", f"{settings.TEABLE_BASE_URL}/base/{base_id}", json={"name": f"{business_name}_database"}, headers=headers),
+    )
+    for result in results:
+        if not result["success"]:
+            logger.warning(f"Failed to rename pooled workspace {space_id}/{base_id}: {result.get('error')}")
+
+workspace_pool = WorkspacePool(settings.WARM_POOL_SIZE, settings.WARM_POOL_FILE, settings.WARM_POOL_RETRY_DELAY)
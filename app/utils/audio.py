@@ -0,0 +1,32 @@
+from typing import BinaryIO, Optional
+import av
+import numpy as np
+
+class AudioTooLongError(ValueError):
+    pass
+
+def decode_audio(source: BinaryIO, sample_rate: int = 16000, max_duration: Optional[float] = None) -> np.ndarray:
+    """Decode an audio file object to mono float32 samples at sample_rate, without touching disk"""
+    max_samples = int(max_duration * sample_rate) if max_duration else None
+    resampler = av.AudioResampler(format="flt", layout="mono", rate=sample_rate)
+    chunks, total = [], 0
+    with av.open(source, mode="r", metadata_errors="ignore") as container:
+        stream = container.streams.audio[0]
+        for frame in _frames(container, stream):
+            for resampled in resampler.resample(frame):
+                array = resampled.to_ndarray().reshape(-1)
+                total += len(array)
+                if max_samples is not None and total > max_samples:
+                    raise AudioTooLongError(f"Audio longer than {max_duration} seconds")
+                chunks.append(array)
+    if not chunks:
+        return np.zeros(0, dtype=np.float32)
+    return np.concatenate(chunks).astype(np.float32, copy=False)
+
+def _frames(container, stream):
+    yield from container.decode(stream)
+    # A final None flushes samples still buffered inside the resampler
+    yield None
+
+def rms(samples: np.ndarray) -> float:
+    return float(np.sqrt(np.mean(samples ** 2))) if len(samples) else 0.0
@@ -0,0 +1,57 @@
+import re
+from typing import Iterator, Optional, Tuple
+from urllib.parse import quote
+from fastapi import Response
+from fastapi.responses import StreamingResponse
+
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+def _parse_range(range_header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Parse a single `bytes=` range into inclusive (start, end), or None if unsatisfiable"""
+    match = _RANGE_RE.match(range_header.strip())
+    if not match or (not match.group(1) and not match.group(2)):
+        return None
+    if not match.group(1):
+        # Suffix range: the last N bytes
+        length = int(match.group(2))
+        if length == 0:
+            return None
+        return max(size - length, 0), size - 1
+    start = int(match.group(1))
+    end = int(match.group(2)) if match.group(2) else size - 1
+    if start >= size or end < start:
+        return None
+    return start, min(end, size - 1)
+
+def _iter_file(path: str, start: int, length: int, chunk_size: int = 64 * 1024) -> Iterator[bytes]:
+    with open(path, "rb") as f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(chunk_size, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+def file_response(path: str, size: int, etag: str, media_type: str, file_name: Optional[str] = None,
+                  range_header: Optional[str] = None, if_none_match: Optional[str] = None) -> Response:
+    """Serve a local file with ETag / If-None-Match and single-range support"""
+    quoted_etag = f'"{etag}"'
+    headers = {"ETag": quoted_etag, "Accept-Ranges": "bytes", "Cache-Control": "private, max-age=86400"}
+    if file_name:
+        headers["Content-Disposition"] = f"inline; filename*=UTF-8''{quote(file_name)}"
+
+    if if_none_match and (if_none_match.strip() == "*" or quoted_etag in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]):
+        return Response(status_code=304, headers=headers)
+
+    if range_header:
+        byte_range = _parse_range(range_header, size)
+        if byte_range is None:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+        start, end = byte_range
+        length = end - start + 1
+        headers.update({"Content-Range": f"bytes {start}-{end}/{size}", "Content-Length": str(length)})
+        return StreamingResponse(_iter_file(path, start, length), status_code=206, media_type=media_type, headers=headers)
+
+    headers["Content-Length"] = str(size)
+    return StreamingResponse(_iter_file(path, 0, size), media_type=media_type, headers=headers)
@@ -0,0 +1,73 @@
+import unicodedata
+from collections import defaultdict
+from typing import Dict, Hashable, List, Optional, Set, Tuple
+
+def fold(text: str) -> str:
+    """Lowercase, strip Vietnamese diacritics and collapse whitespace: "Bia Hà Nội" -> "bia ha noi" """
+    text = unicodedata.normalize("NFD", text.lower().replace("đ", "d"))
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return " ".join("".join(ch if ch.isalnum() else " " for ch in text).split())
+
+def trigrams(folded: str) -> Set[str]:
+    padded = f"  {folded} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+class TrigramIndex:
+    """Diacritic-insensitive fuzzy lookup of short names, scored by trigram Dice similarity"""
+
+    def __init__(self):
+        self._grams: Dict[Hashable, Set[str]] = {}
+        self._postings: Dict[str, Set[Hashable]] = defaultdict(set)
+        self._exact: Dict[str, Set[Hashable]] = defaultdict(set)
+        self._folded: Dict[Hashable, str] = {}
+
+    def __len__(self) -> int:
+        return len(self._grams)
+
+    def add(self, key: Hashable, name: str) -> None:
+        self.remove(key)
+        folded = fold(name)
+        if not folded:
+            return
+        grams = trigrams(folded)
+        self._grams[key] = grams
+        self._folded[key] = folded
+        self._exact[folded].add(key)
+        for gram in grams:
+            self._postings[gram].add(key)
+
+    def remove(self, key: Hashable) -> None:
+        grams = self._grams.pop(key, None)
+        if grams is None:
+            return
+        folded = self._folded.pop(key)
+        self._exact[folded].discard(key)
+        if not self._exact[folded]:
+            del self._exact[folded]
+        for gram in grams:
+            self._postings[gram].discard(key)
+            if not self._postings[gram]:
+                del self._postings[gram]
+
+    def search(self, name: str, limit: int = 5, threshold: float = 0.0) -> List[Tuple[Hashable, float]]:
+        """Return up to `limit` (key, score) pairs with score in 0..1, best first"""
+        folded = fold(name)
+        if not folded:
+            return []
+        exact = self._exact.get(folded)
+        if exact:
+            return [(key, 1.0) for key in list(exact)[:limit]]
+
+        grams = trigrams(folded)
+        common: Dict[Hashable, int] = defaultdict(int)
+        for gram in grams:
+            for key in self._postings.get(gram, ()):
+                common[key] += 1
+        scored = [(key, 2 * count / (len(grams) + len(self._grams[key]))) for key, count in common.items()]
+        scored = [(key, score) for key, score in scored if score >= threshold]
+        scored.sort(key=lambda pair: pair[1], reverse=True)
+        return scored[:limit]
+
+    def best(self, name: str, threshold: float) -> Optional[Tuple[Hashable, float]]:
+        matches = self.search(name, limit=1, threshold=threshold)
+        return matches[0] if matches else None
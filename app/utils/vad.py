@@ -0,0 +1,78 @@
+from collections import deque
+from typing import List, Optional
+import numpy as np
+
+# Audio kept from just before speech starts so the first syllable is not clipped
+_PRE_ROLL_MS = 200
+
+class SpeechSegmenter:
+    """Incremental energy-based VAD that splits a 16-bit PCM stream into speech segments"""
+
+    def __init__(self, sample_rate: int = 16000, frame_ms: int = 30, threshold: float = 0.01,
+                 silence_ms: int = 600, min_segment_ms: int = 300, max_segment_ms: int = 15000):
+        self.sample_rate = sample_rate
+        self.threshold = threshold
+        self.frame_len = sample_rate * frame_ms // 1000
+        self.silence_frames = max(1, silence_ms // frame_ms)
+        self.min_frames = max(1, min_segment_ms // frame_ms)
+        self.max_frames = max(1, max_segment_ms // frame_ms)
+        self.samples = 0
+        self._odd_byte = b""
+        self._tail = np.zeros(0, dtype=np.float32)
+        self._pre_roll = deque(maxlen=max(1, _PRE_ROLL_MS // frame_ms))
+        self._segment: List[np.ndarray] = []
+        self._voiced = 0
+        self._silent = 0
+
+    def _emit(self) -> Optional[np.ndarray]:
+        segment, voiced = self._segment, self._voiced
+        self._segment, self._voiced, self._silent = [], 0, 0
+        if voiced < self.min_frames:
+            return None
+        return np.concatenate(segment)
+
+    def feed(self, pcm: bytes) -> List[np.ndarray]:
+        """Add raw PCM bytes and return the float32 segments that finished"""
+        pcm = self._odd_byte + pcm
+        even = len(pcm) - len(pcm) % 2
+        self._odd_byte = pcm[even:]
+        samples = np.frombuffer(pcm[:even], dtype="<i2").astype(np.float32) / 32768.0
+        self.samples += len(samples)
+        samples = np.concatenate([self._tail, samples])
+
+        count = len(samples) // self.frame_len
+        self._tail = samples[count * self.frame_len:]
+        if not count:
+            return []
+        frames = samples[:count * self.frame_len].reshape(count, self.frame_len)
+        voiced_flags = np.sqrt(np.mean(frames ** 2, axis=1)) >= self.threshold
+
+        finished = []
+        for frame, voiced in zip(frames, voiced_flags):
+            if not self._segment:
+                if voiced:
+                    self._segment = [*self._pre_roll, frame]
+                    self._pre_roll.clear()
+                    self._voiced = 1
+                else:
+                    self._pre_roll.append(frame)
+                continue
+
+            self._segment.append(frame)
+            if voiced:
+                self._voiced += 1
+                self._silent = 0
+            else:
+                self._silent += 1
+            if self._silent >= self.silence_frames or len(self._segment) >= self.max_frames:
+                segment = self._emit()
+                if segment is not None:
+                    finished.append(segment)
+        return finished
+
+    def flush(self) -> Optional[np.ndarray]:
+        """Close the stream and return the last segment if it contains speech"""
+        if self._segment and len(self._tail):
+            self._segment.append(self._tail)
+        self._tail = np.zeros(0, dtype=np.float32)
+        return self._emit() if self._segment else None
@@ -0,0 +1,52 @@
+"""Peak memory per invoice attachment upload: temp-file upload vs streamed multipart body.
+
+Run from the repository root:  python -m benchmarks.attachment_memory [size_mb]
+"""
+import os
+import sys
+import base64
+import asyncio
+import tempfile
+import tracemalloc
+import httpx
+from app.core import http_client
+from app.services.teable_service import upload_attachment_to_teable
+
+class DrainTransport(httpx.AsyncBaseTransport):
+    """Reads the request body chunk by chunk like a socket would (httpx.MockTransport buffers it whole)"""
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        received = 0
+        async for chunk in request.stream:
+            received += len(chunk)
+        return httpx.Response(200, json={"received": received})
+
+async def legacy_upload(client: httpx.AsyncClient, file_to_bytes: str, file_name: str) -> None:
+    """The previous implementation: decode everything, write a temp file, re-read it for the upload"""
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as temp_file:
+        temp_file.write(base64.b64decode(file_to_bytes))
+        temp_file_path = temp_file.name
+    try:
+        with open(temp_file_path, "rb") as f:
+            await client.post("https://teable.local/upload", files={"file": (file_name, f, "application/pdf")})
+    finally:
+        os.remove(temp_file_path)
+
+async def measure(label: str, coro_factory) -> None:
+    tracemalloc.start()
+    await coro_factory()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<22} peak {peak / 1024 / 1024:8.2f} MiB")
+
+async def main(size_mb: float) -> None:
+    file_to_bytes = base64.b64encode(os.urandom(int(size_mb * 1024 * 1024))).decode("ascii")
+    client = httpx.AsyncClient(transport=DrainTransport())
+    http_client._teable_client = client
+    print(f"PDF size {size_mb} MiB (base64 input held by caller: {len(file_to_bytes) / 1024 / 1024:.2f} MiB, not counted)")
+    await measure("temp file (legacy)", lambda: legacy_upload(client, file_to_bytes, "invoice.pdf"))
+    await measure("streamed multipart", lambda: upload_attachment_to_teable("fld", "rec", "tbl", file_to_bytes, "invoice.pdf"))
+    await client.aclose()
+
+if __name__ == "__main__":
+    asyncio.run(main(float(sys.argv[1]) if len(sys.argv) > 1 else 5))
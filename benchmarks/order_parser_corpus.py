@@ -0,0 +1,74 @@
+"""Accuracy and local share of the rule-based order parser on a corpus of spoken orders.
+
+Run from the repository root:  python -m benchmarks.order_parser_corpus [min_confidence]
+Expected items are (ten_hang_hoa, so_luong, don_gia); None marks utterances that should go to the LLM.
+"""
+import sys
+import time
+from app.core.config import settings
+from app.order_parser import parse_order_text
+
+CORPUS = [
+    ("hai thùng bia giá hai trăm rưỡi nghìn", [("bia", 2, 250000)]),
+    ("ba lốc sữa giá một trăm hai mươi nghìn", [("sữa", 3, 120000)]),
+    ("năm cái áo mỗi cái một trăm hai mươi lăm nghìn", [("áo", 5, 125000)]),
+    ("một chiếc TV Samsung giá hai triệu một trăm tám mươi nghìn", [("TV Samsung", 1, 2180000)]),
+    ("cho tôi ba hộp sữa giá năm mươi nghìn một hộp", [("sữa", 3, 50000)]),
+    ("ba kg thịt bò 250.000đ, hai chai nước mắm giá 45k", [("thịt bò", 3, 250000), ("nước mắm", 2, 45000)]),
+    ("hai thùng bia hai trăm nghìn ba lốc sữa một trăm nghìn", [("bia", 2, 200000), ("sữa", 3, 100000)]),
+    ("mười hai chai nước suối giá năm nghìn", [("nước suối", 12, 5000)]),
+    ("hai mươi mốt gói mì giá ba nghìn rưỡi", [("mì", 21, 3500)]),
+    ("một bao gạo giá ba trăm linh năm nghìn", [("gạo", 1, 305000)]),
+    ("bốn cái quạt điện giá một triệu rưỡi", [("quạt điện", 4, 1500000)]),
+    ("laptop Dell giá 2,5 triệu", [("laptop Dell", 1, 2500000)]),
+    ("hai cái tủ lạnh giá năm triệu tư", [("tủ lạnh", 2, 5400000)]),
+    ("lấy sáu lon nước ngọt giá tám nghìn một lon và hai gói bánh giá mười lăm nghìn", [("nước ngọt", 6, 8000), ("bánh", 2, 15000)]),
+    ("một trăm cái bút bi giá ba nghìn", [("bút bi", 100, 3000)]),
+    ("hai kg cà chua giá hai mươi lăm nghìn, một kg hành giá ba mươi nghìn", [("cà chua", 2, 25000), ("hành", 1, 30000)]),
+    ("một két bia Sài Gòn giá ba trăm hai mươi nghìn", [("bia Sài Gòn", 1, 320000)]),
+    ("hai chai dầu ăn 55.000 đồng", [("dầu ăn", 2, 55000)]),
+    ("mười cuộn giấy vệ sinh giá bốn nghìn năm trăm", [("giấy vệ sinh", 10, 4500)]),
+    ("ba đôi giày giá bảy trăm nghìn", [("giày", 3, 700000)]),
+    ("một máy giặt giá tám triệu chín trăm nghìn", [("máy giặt", 1, 8900000)]),
+    ("bia Tiger ba thùng giá ba trăm tám mươi nghìn", [("bia Tiger", 3, 380000)]),
+    ("năm bịch đường giá hai mươi hai nghìn", [("đường", 5, 22000)]),
+    ("hai hộp bánh quy 65k mỗi hộp", [("bánh quy", 2, 65000)]),
+    # Ambiguous or unstructured: expected to fall back to the LLM
+    ("hai thùng bia giá hai trăm rưỡi", None),
+    ("tôi muốn đặt một ít hàng như hôm qua", None),
+    ("anh ơi cho em cái loại hôm trước ấy", None),
+    ("ba cái áo sơ mi trắng cổ bẻ dài tay size lớn", None),
+    ("bia ba ba ba hai thùng", None),
+    ("hai nghìn", None),
+]
+
+def _normalize(items):
+    return [(str(i["ten_hang_hoa"]).lower(), i["so_luong"], i["don_gia"]) for i in items]
+
+def main() -> None:
+    threshold = float(sys.argv[1]) if len(sys.argv) > 1 else settings.LOCAL_PARSER_MIN_CONFIDENCE
+    local = correct = misrouted = 0
+    started = time.perf_counter()
+    for text, expected in CORPUS:
+        items, confidence = parse_order_text(text)
+        if confidence < threshold:
+            if expected is not None:
+                print(f"  to LLM ({confidence:.2f}): {text}")
+            continue
+        local += 1
+        expected_items = [(name.lower(), qty, price) for name, qty, price in expected] if expected else None
+        if expected_items == _normalize(items):
+            correct += 1
+        else:
+            misrouted += expected is None
+            print(f"  WRONG  ({confidence:.2f}): {text} -> {items}")
+    elapsed = (time.perf_counter() - started) / len(CORPUS) * 1e6
+
+    print(f"utterances        {len(CORPUS)}")
+    print(f"served locally    {local} ({local / len(CORPUS):.0%})")
+    print(f"local accuracy    {correct}/{local}")
+    print(f"should be LLM     {misrouted} answered locally")
+    print(f"parse time        {elapsed:.0f} us/utterance")
+
+if __name__ == "__main__":
+    main()